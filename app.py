@@ -0,0 +1,817 @@
+from kivy.core.window import Window
+from kivy.metrics import dp
+from kivy.uix.behaviors import ButtonBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivymd.app import MDApp
+from kivymd.uix.boxlayout import MDBoxLayout
+from kivymd.uix.datatables import MDDataTable
+from kivymd.uix.dialog import MDDialog
+from kivymd.uix.label import MDLabel
+from kivymd.uix.button import MDRaisedButton, MDIconButton, MDFlatButton
+from kivymd.uix.list import MDList, OneLineListItem
+from kivymd.uix.menu import MDDropdownMenu
+from kivymd.uix.progressbar import MDProgressBar
+from kivymd.uix.recycleview import MDRecycleView
+from kivymd.uix.relativelayout import MDRelativeLayout
+from kivymd.uix.scrollview import MDScrollView
+from kivymd.uix.selectioncontrol import MDCheckbox
+from kivymd.uix.stacklayout import MDStackLayout
+from kivymd.uix.textfield import MDTextField
+import jobs
+from tagsparser import engine, mappingstore, profiling, rules, tagindex, tagmodel
+
+
+class PressableOneLineItem(OneLineListItem, ButtonBehavior):
+    pass
+
+
+class TagsList(MDRecycleView):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.viewclass = PressableOneLineItem
+        self.tags = tagindex.FilteredTags()
+
+        layout = RecycleBoxLayout(orientation="vertical",
+                                  default_size=(None, dp(48)),
+                                  default_size_hint=(1, None),
+                                  size_hint_y=None)
+        layout.bind(minimum_height=layout.setter("height"))
+        self.add_widget(layout)
+
+    def setItems(self, items, index=None):
+        # items: [(group, {"text": tag, ...view properties})]
+        with profiling.phase("ui.setItems") as stats:
+            self.tags.setItems(items, index)
+            self.data = self.tags.visibleItems
+            stats["rows"] = len(self.data)
+
+    def setFilter(self, query):
+        # data holds only the visible items, the full list lives in tags
+        with profiling.phase("ui.filter") as stats:
+            self.tags.setFilter(query)
+            self.data = self.tags.visibleItems
+            stats["rows"] = len(self.data)
+
+    def indexOf(self, text):
+        return self.tags.indexOf(text)
+
+    def getItem(self, text):
+        return self.tags.getItem(text)
+
+    def addItem(self, item, group=0):
+        self.removeItem(item["text"])
+        idx = self.tags.add(group, item)
+        if idx is not None:
+            self.data.insert(idx, item)
+
+    def removeItem(self, text):
+        idx = self.tags.remove(text)
+        if idx is not None:
+            del self.data[idx]
+
+    def updateItem(self, text, **props):
+        item = self.getItem(text)
+        if item is not None:
+            item.update(props)
+            self.refresh_from_data()
+
+    def updateItems(self, itemProps):
+        for text, props in itemProps.items():
+            item = self.getItem(text)
+            if item is not None:
+                item.update(props)
+        self.refresh_from_data()
+
+    def applyChanges(self, removed, added):
+        # added: [(group, item)]; the visible part is rebuilt once instead of per item
+        self.tags.applyChanges(removed, added)
+        self.data = self.tags.visibleItems
+
+    def getVisibleTexts(self):
+        return self.tags.getVisibleTexts()
+
+    def __contains__(self, text):
+        return text in self.tags
+
+
+class FilterField(MDTextField):
+
+    def __init__(self, tagsList, **kwargs):
+        super().__init__(hint_text="Поиск", size_hint_y=None, **kwargs)
+        self.tagsList = tagsList
+        self.bind(text=lambda field, text: self.tagsList.setFilter(text))
+
+
+class ProgressContent(MDBoxLayout):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.orientation = "vertical"
+        self.size_hint_y = None
+        self.height = dp(72)
+        self.spacing = 10
+
+        self.progressBar = MDProgressBar(type="indeterminate")
+        self.progressLabel = MDLabel(text="")
+        self.add_widget(self.progressBar)
+        self.add_widget(self.progressLabel)
+        self.progressBar.start()
+
+    def setProgress(self, rowsDone, rowsTotal, rowsPerSec):
+        if rowsTotal:
+            if self.progressBar.type != "determinate":
+                self.progressBar.stop()
+                self.progressBar.type = "determinate"
+            self.progressBar.value = min(100, 100 * rowsDone / rowsTotal)
+            self.progressLabel.text = "Строк: %d из %d, %d строк/с" % (rowsDone, rowsTotal, rowsPerSec)
+        else:
+            self.progressLabel.text = "Строк: %d, %d строк/с" % (rowsDone, rowsPerSec)
+
+
+class PreviewContent(MDBoxLayout):
+
+    def __init__(self, scans, conf, getSourceLabel, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.orientation = "vertical"
+        self.spacing = 10
+        self.scans = scans
+        self.conf = conf
+        self.getSourceLabel = getSourceLabel
+        self.table = None
+
+        optionsRow = MDBoxLayout(orientation="horizontal", size_hint_y=None, height=dp(56), spacing=10)
+        self.rowLimitField = MDTextField(hint_text="Сколько строк", text=str(engine.PREVIEW_ROWS),
+                                         input_filter="int")
+        self.sampleCheckbox = MDCheckbox(size_hint=(None, None), size=(dp(48), dp(48)))
+        optionsRow.add_widget(self.rowLimitField)
+        optionsRow.add_widget(self.sampleCheckbox)
+        optionsRow.add_widget(MDLabel(text="Случайные строки"))
+        optionsRow.add_widget(MDRaisedButton(text="Обновить", on_release=lambda x: self.refresh()))
+        self.add_widget(optionsRow)
+
+        self.summaryLabel = MDLabel(size_hint_y=None)
+        self.summaryLabel.bind(texture_size=lambda label, size: setattr(label, "height", size[1]))
+        self.add_widget(self.summaryLabel)
+        self.refresh()
+
+    def refresh(self):
+        # the int filter still lets through a lone or leading minus
+        try:
+            rowLimit = max(0, int(self.rowLimitField.text))
+        except ValueError:
+            rowLimit = 0
+        with profiling.phase("ui.preview") as stats:
+            preview = engine.previewClassification(self.scans, self.conf["used"], rowLimit=rowLimit,
+                                                   sample=self.sampleCheckbox.active)
+            stats["rows"] = len(preview["rows"])
+        if self.table:
+            self.remove_widget(self.table)
+        columnData = [("Строка", dp(20)), ("Колонка с тегами", dp(30)), ("Теги", dp(50))]
+        columnData.extend((colName, dp(30)) for colName in preview["columnNames"])
+        rowData = [(str(row["rowNum"]), self.getSourceLabel(row["source"]), ", ".join(row["tags"]))
+                   + tuple("" if value is None else str(value) for value in row["values"])
+                   for row in preview["rows"]]
+        self.table = MDDataTable(column_data=columnData, row_data=rowData,
+                                 use_pagination=True, rows_num=20)
+        self.add_widget(self.table)
+
+        lines = []
+        for source, summary in preview["summary"].items():
+            for colName, counts in zip(preview["columnNames"], summary):
+                lines.append("%s → %s: без тегов %d, по умолчанию %d, один тег %d, много %d"
+                             % (self.getSourceLabel(source), colName, counts[engine.EMPTY],
+                                counts[engine.DEFAULT], counts[engine.SINGLE], counts[engine.MULTIPLE]))
+        self.summaryLabel.text = "\n".join(lines)
+
+
+class DialogContent(MDBoxLayout):
+
+    def __init__(self, *args, **kwargs):
+        inputData = kwargs.pop("dataDict")
+        self.columnName = ""
+        self.creationName = ""
+        self.defaultValue = ""
+        self.multipleValue = ""
+        self.rulesText = ""
+        self.tagsSet = set()
+
+        super().__init__(*args, **kwargs)
+        self.orientation = "vertical"
+
+        self.columnNameTextField = MDTextField(hint_text="Название колонки")
+        self.defaultTextField = MDTextField(hint_text="Значение, если ничего не нашлось")
+        self.multipleTextField = MDTextField(hint_text="Значение, если нашлось слишком много")
+        self.rulesTextField = MDTextField(hint_text="Правила по одному в строке: norm:, prefix:, substring:, regex:",
+                                          multiline=True, max_height=dp(120))
+        self.tagsList = TagsList()
+
+        if inputData:
+            self.columnNameTextField.text = self.columnName = inputData["columnName"]
+            self.creationName = inputData["columnName"]
+            self.defaultTextField.text = self.defaultValue = inputData["default"]
+            self.multipleTextField.text = self.multipleValue = inputData["multiple"]
+            self.rulesTextField.text = self.rulesText = rules.formatRules(inputData.get("rules", []))
+            self.tagsSet.update(inputData["all"])
+            self.tagsList.setItems([(0, {"text": tag,
+                                         "on_release": lambda tag=tag: self.askDelete(tag)})
+                                    for tag in self.tagsSet])
+
+        self.columnNameTextField.bind(text=self.textValueChange)
+        self.defaultTextField.bind(text=self.textValueChange)
+        self.multipleTextField.bind(text=self.textValueChange)
+        self.rulesTextField.bind(text=self.textValueChange)
+
+        self.add_widget(self.columnNameTextField)
+        self.add_widget(self.defaultTextField)
+        self.add_widget(self.multipleTextField)
+        self.add_widget(self.rulesTextField)
+
+        self.tagsList.size_hint = (1, 1)
+        self.add_widget(FilterField(self.tagsList))
+        self.add_widget(self.tagsList)
+
+    def textValueChange(self, field, val):
+        if field == self.defaultTextField:
+            self.defaultValue = val
+        elif field == self.columnNameTextField:
+            self.columnName = val
+        elif field == self.multipleTextField:
+            self.multipleValue = val
+        elif field == self.rulesTextField:
+            self.rulesText = val
+
+    def askDelete(self, tag):
+        confirmDialog = MDDialog(
+            text="Удалить тег \"%s\" ?" % tag,
+            buttons=[
+                MDFlatButton(
+                    text="Отмена",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: confirmDialog.dismiss()
+                ),
+                MDFlatButton(
+                    text="OK",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.removeTag(confirmDialog, tag)
+                )
+            ],
+        )
+        confirmDialog.open()
+        return True
+
+    def removeTag(self, dialog, tag):
+        self.tagsSet.remove(tag)
+        self.tagsList.removeItem(tag)
+        dialog.dismiss()
+
+
+class MainApp(MDApp):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+        self.confirmDialog = None
+        self.errDialog = None
+        self.dialog = None
+        self.usedTagsContainer = None
+        self.columnItems = dict()
+        self.unusedTagsContainer = None
+        self.columnsMenu = None
+        self.columnSelector = None
+        self.mainContainer = None
+        self.filePath = None
+        self.sheetColumns = None
+        self.sources = []
+        self.scans = dict()
+        self.listsContainer = None
+        self.progressDialog = None
+
+        self.theme_cls.theme_style = "Dark"
+        self.theme_cls.primary_palette = "Lime"
+
+        self.mainWidget = MDRelativeLayout()
+        self.mainWidget.size_hint = (1, 1)
+        self.mainWidget.add_widget(MDLabel(text="Положи сюда файл", halign="center"))
+
+        self.store = mappingstore.openStore()
+        self.conf = self.store.load()
+        self.tagModel = tagmodel.TagStateModel(self.conf)
+        self.tagModel.listeners.append(self.tagStateChanged)
+        self.tagModel.batchListeners.append(self.tagStatesChanged)
+
+    def prepareWorkspace(self):
+        self.mainWidget.clear_widgets()
+        controlArea = MDBoxLayout(orientation="horizontal")
+        controlArea.size_hint = (1, 0.1)
+        controlArea.radius = (25, 25, 25, 25)
+        controlArea.padding = 10
+        controlArea.spacing = 5
+        controlArea.md_bg_color = self.theme_cls.bg_dark
+        doneBtn = MDRaisedButton(text="Сохранить",
+                                 on_release=lambda x: self.saveResults())
+        doneBtn.pos_hint = {"center_y": 0.5}
+        fileNameLbl = MDLabel(text=self.filePath.split("\\")[-1])
+        fileNameLbl.pos_hint = {"center_y": 0.5}
+        fileNameLbl.bind(size=fileNameLbl.setter("texture_size"))
+        self.columnSelector = MDRaisedButton(text="Выбери колонку с тегами",
+                                             on_release=lambda x: self.openColumnsMenu())
+        self.columnSelector.pos_hint = {"center_y": 0.5,
+                                        "right": 1}
+        self.sources = []
+        self.columnsMenu = MDDropdownMenu(caller=self.columnSelector, items=self.makeColumnsMenuItems())
+        scanBtn = MDRaisedButton(text="Читать теги",
+                                 on_release=lambda x: self.scanSources())
+        scanBtn.pos_hint = {"center_y": 0.5}
+
+        statsBtn = MDIconButton(icon="chart-bar",
+                                on_release=lambda x: self.showStatsDialog())
+        statsBtn.pos_hint = {"center_y": 0.5}
+        previewBtn = MDIconButton(icon="eye",
+                                  on_release=lambda x: self.showPreviewDialog())
+        previewBtn.pos_hint = {"center_y": 0.5}
+
+        controlArea.add_widget(fileNameLbl)
+        controlArea.add_widget(self.columnSelector)
+        controlArea.add_widget(scanBtn)
+        controlArea.add_widget(statsBtn)
+        controlArea.add_widget(previewBtn)
+        controlArea.add_widget(doneBtn)
+
+        self.mainContainer = MDStackLayout()
+        self.mainContainer.size_hint = (1, 1)
+        self.mainContainer.padding = 10
+        self.mainContainer.spacing = 10
+        self.mainContainer.orientation = "tb-rl"
+        self.mainContainer.add_widget(controlArea)
+        self.mainWidget.add_widget(self.mainContainer)
+
+    def openColumnsMenu(self):
+        self.columnsMenu.open()
+
+    def getSourceLabel(self, source):
+        sheet, column = source
+        return engine.formatSource((sheet if len(self.sheetColumns) > 1 else None, column))
+
+    def makeColumnsMenuItems(self):
+        return [
+            {
+                "text": ("✓ " if (sheet, col) in self.sources else "") + self.getSourceLabel((sheet, col)),
+                "on_release": lambda x=(sheet, col): self.columnSelected(x),
+            } for sheet, columns in self.sheetColumns.items() for col in columns
+        ]
+
+    def columnSelected(self, source):
+        if source in self.sources:
+            self.sources.remove(source)
+        else:
+            self.sources.append(source)
+        self.columnSelector.text = ", ".join(map(self.getSourceLabel, self.sources)) or "Выбери колонку с тегами"
+        self.columnsMenu.items = self.makeColumnsMenuItems()
+        self.columnsMenu.dismiss()
+
+    def scanSources(self):
+        if not self.sources:
+            self.showErrDialog("Выбери хотя бы одну колонку с тегами")
+            return
+        sources = list(self.sources)
+        self.runJob("scan", "Читаю теги", lambda job: self.scanAndIndex(job, sources), self.showTagLists)
+
+    def scanAndIndex(self, job, sources):
+        # the filter index takes a second or so on 100k tags, so it is built here and not on the UI thread
+        scans = engine.scanSources(self.filePath, sources, progress=job.progress)
+        with profiling.phase("scan.buildIndex") as stats:
+            index = tagindex.TagIndex(set().union(*(scan.vocabulary for scan in scans.values())))
+            stats["rows"] = len(index.folded)
+        return scans, index
+
+    def showTagLists(self, result):
+        scans, index = result
+        self.scans = scans
+        if self.listsContainer:
+            self.mainContainer.remove_widget(self.listsContainer)
+        listsContainer = self.listsContainer = MDBoxLayout(orientation="horizontal")
+        listsContainer.size_hint = (1, 0.9)
+        listsContainer.radius = (25, 25, 25, 25)
+        listsContainer.padding = 10
+        listsContainer.spacing = 50
+        listsContainer.md_bg_color = self.theme_cls.bg_dark
+
+        sheetTags = set()
+        for scan in scans.values():
+            sheetTags.update(scan.vocabulary)
+        self.tagModel.loadSheet(sheetTags, self.store.loadPending())
+        self.unusedTagsContainer = TagsList()
+        self.unusedTagsContainer.scroll_type = ['bars']
+        self.unusedTagsContainer.bar_color = self.theme_cls.primary_color
+        self.unusedTagsContainer.bar_inactive_color = self.theme_cls.accent_color
+        self.unusedTagsContainer.bar_width = 5
+        self.fillUnusedContainer(index)
+        unusedBox = MDBoxLayout(orientation="vertical")
+        filterRow = MDBoxLayout(orientation="horizontal", size_hint_y=None, height=dp(56))
+        filterRow.add_widget(FilterField(self.unusedTagsContainer))
+        filterRow.add_widget(MDIconButton(icon="select-all",
+                                          on_press=lambda x: self.selectAllFiltered()))
+        filterRow.add_widget(MDIconButton(icon="archive-arrow-down",
+                                          on_press=lambda x: self.askMarkUnused()))
+        unusedBox.add_widget(filterRow)
+        unusedBox.add_widget(self.unusedTagsContainer)
+        listsContainer.add_widget(unusedBox)
+
+        structureContainer = MDRelativeLayout()
+        self.usedTagsContainer = MDList()
+        self.columnItems = dict()
+        configuredColumns = sorted(list(self.conf["used"].keys()), key=str.casefold)
+        for col in configuredColumns:
+            self.addColumnItem(col)
+        addBtn = MDIconButton(icon="plus",
+                              theme_icon_color="Custom",
+                              icon_color=self.theme_cls.bg_darkest,
+                              on_press=lambda x: self.openConfigureColumnPopup(""))
+        addBtn.pos_hint = {"center_x": 0.9,
+                           "center_y": 0.1}
+        addBtn.md_bg_color = self.theme_cls.primary_color
+        usedTagsContainerScroll = MDScrollView()
+        usedTagsContainerScroll.scroll_type = ['bars']
+        usedTagsContainerScroll.bar_color = self.theme_cls.primary_color
+        usedTagsContainerScroll.bar_inactive_color = self.theme_cls.accent_color
+        usedTagsContainerScroll.bar_width = 5
+        usedTagsContainerScroll.add_widget(self.usedTagsContainer)
+        structureContainer.add_widget(usedTagsContainerScroll)
+        structureContainer.add_widget(addBtn)
+        listsContainer.add_widget(structureContainer)
+
+        self.mainContainer.add_widget(listsContainer)
+
+    def runJob(self, name, title, target, onDone, cancellable=False):
+        content = ProgressContent()
+        buttons = []
+        if cancellable:
+            buttons.append(MDFlatButton(text="Отмена",
+                                        theme_text_color="Custom",
+                                        text_color=self.theme_cls.primary_color,
+                                        on_press=lambda x: job.cancel()))
+        self.progressDialog = MDDialog(title=title,
+                                       type="custom",
+                                       content_cls=content,
+                                       buttons=buttons,
+                                       auto_dismiss=False)
+        job = jobs.Job(name, target,
+                       onDone=lambda result: self.jobFinished(onDone, result),
+                       onError=self.jobFailed,
+                       onCancelled=self.jobCancelled,
+                       onProgress=content.setProgress)
+        self.progressDialog.open()
+        return job.start()
+
+    def jobFinished(self, onDone, result):
+        self.progressDialog.dismiss()
+        onDone(result)
+
+    def jobFailed(self, error):
+        self.progressDialog.dismiss()
+        self.showErrDialog("Ошибка: %s" % error)
+
+    def jobCancelled(self):
+        self.progressDialog.dismiss()
+        self.showErrDialog("Отменено")
+
+    def fillUnusedContainer(self, index=None):
+        with profiling.phase("ui.fillUnusedContainer") as stats:
+            items = [(0, self.makeUnusedItem(tag)) for tag in self.tagModel.newTags]
+            items.extend((1, self.makeUnusedItem(tag)) for tag in self.tagModel.unusedTags)
+            self.unusedTagsContainer.setItems(items, index)
+            stats["rows"] = len(items)
+
+    def showStatsDialog(self):
+        lines = []
+        for name, total in profiling.tracer.summary().items():
+            peakRss = "%d МБ" % (total["peakRssKb"] // 1024) if total["peakRssKb"] is not None else "н/д"
+            lines.append("%s: %.2f с (CPU %.2f с), строк: %d, пик памяти процесса: %s"
+                         % (name, total["wallSeconds"], total["cpuSeconds"], total["rows"], peakRss))
+        self.dialog = MDDialog(
+            title="Статистика",
+            text="\n".join(lines) or "Пока ничего не замерено",
+            buttons=[
+                MDFlatButton(
+                    text="OK",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.dialog.dismiss(),
+                ),
+            ],
+        )
+        self.dialog.open()
+
+    def showPreviewDialog(self):
+        if not self.scans:
+            self.showErrDialog("Сначала прочитай теги")
+            return
+        self.dialog = MDDialog(
+            title="Предпросмотр",
+            type="custom",
+            size_hint=(1, 1),
+            content_cls=PreviewContent(dict(self.scans), self.conf, self.getSourceLabel,
+                                       size_hint=(None, None),
+                                       width=self.mainWidget.width * 0.9,
+                                       height=self.mainWidget.height * 0.8),
+            buttons=[
+                MDFlatButton(
+                    text="OK",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.dialog.dismiss(),
+                ),
+            ],
+        )
+        self.dialog.open()
+
+    def makeUnusedItem(self, tag):
+        if tag in self.tagModel.selectedTags:
+            return {"text": tag,
+                    "theme_text_color": "Custom",
+                    "text_color": self.theme_cls.bg_dark,
+                    "bg_color": self.theme_cls.primary_color,
+                    "divider_color": self.theme_cls.bg_light,
+                    "on_release": lambda: self.selectTag(tag)}
+        if self.tagModel.getState(tag) == tagmodel.NEW:
+            return {"text": tag,
+                    "theme_text_color": "Custom",
+                    "text_color": self.theme_cls.primary_color,
+                    "bg_color": self.theme_cls.bg_dark,
+                    "divider_color": self.theme_cls.primary_color,
+                    "on_release": lambda: self.selectTag(tag)}
+        return {"text": tag,
+                "theme_text_color": "Custom",
+                "text_color": self.theme_cls.text_color,
+                "bg_color": self.theme_cls.bg_dark,
+                "divider_color": self.theme_cls.bg_light,
+                "on_release": lambda: None}
+
+    def tagStateChanged(self, tag, oldState, newState):
+        if self.unusedTagsContainer is None:
+            return
+        if newState == tagmodel.NEW:
+            self.unusedTagsContainer.addItem(self.makeUnusedItem(tag), group=0)
+        elif newState == tagmodel.UNUSED:
+            self.unusedTagsContainer.addItem(self.makeUnusedItem(tag), group=1)
+        else:
+            self.unusedTagsContainer.removeItem(tag)
+
+    def tagStatesChanged(self, changes):
+        if self.unusedTagsContainer is None:
+            return
+        finalStates = {tag: newState for tag, oldState, newState in changes}
+        removed = [tag for tag, state in finalStates.items() if state not in (tagmodel.NEW, tagmodel.UNUSED)]
+        added = [(0 if state == tagmodel.NEW else 1, self.makeUnusedItem(tag))
+                 for tag, state in finalStates.items() if state in (tagmodel.NEW, tagmodel.UNUSED)]
+        self.unusedTagsContainer.applyChanges(removed, added)
+
+    def addColumnItem(self, colName):
+        lstItem = PressableOneLineItem(text=colName,
+                                       on_press=lambda x: self.columnClicked(colName))
+        self.columnItems[colName] = lstItem
+        self.usedTagsContainer.add_widget(lstItem)
+
+    def removeColumnItem(self, colName):
+        lstItem = self.columnItems.pop(colName, None)
+        if lstItem:
+            self.usedTagsContainer.remove_widget(lstItem)
+
+    def openConfigureColumnPopup(self, colName):
+        if colName != "":
+            data = dict()
+            data.update(self.conf["used"][colName])
+            data["columnName"] = colName
+        else:
+            data = None
+
+        self.dialog = MDDialog(
+            type="custom",
+            size_hint=(1, 1),
+            content_cls=DialogContent(dataDict=data,
+                                      size_hint=(None, None),
+                                      width=self.mainWidget.width * 0.6,
+                                      height=self.mainWidget.height * 0.8),
+            buttons=[
+                MDFlatButton(
+                    text="Удалить столбец",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.showConfirmDialog("Удалить столбец?", lambda: self.delColumn(colName)),
+                    disabled=(colName == "")
+                ),
+                MDFlatButton(
+                    text="Отмена",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.dialog.dismiss(),
+                ),
+                MDFlatButton(
+                    text="OK",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.addOrModifyColumn(self.dialog.content_cls.columnName,
+                                                              self.dialog.content_cls.creationName,
+                                                              self.dialog.content_cls.defaultValue,
+                                                              self.dialog.content_cls.multipleValue,
+                                                              self.dialog.content_cls.tagsSet,
+                                                              self.dialog.content_cls.rulesText),
+                ),
+            ],
+        )
+        self.dialog.open()
+        return True
+
+    def addOrModifyColumn(self, columnName, creationName, defaultValue, multipleValue, tagsSet, rulesText=""):
+        if columnName == "":
+            self.showErrDialog("Надо назвать колонку")
+            return
+        if columnName != creationName and columnName in self.conf["used"]:
+            self.showErrDialog("Такая колонка уже есть")
+            return
+        try:
+            columnRules = rules.parseRules(rulesText)
+        except rules.RuleError as e:
+            self.showErrDialog(str(e))
+            return
+        with self.store.transaction(), self.tagModel.batch():
+            colData, addedToUnused = self.tagModel.updateColumn(columnName, creationName, defaultValue,
+                                                                multipleValue, tagsSet, columnRules)
+            self.store.addUnused(addedToUnused)
+            self.store.putColumn(columnName, colData, replaces=creationName or None)
+        if columnName != creationName:
+            self.removeColumnItem(creationName)
+            self.addColumnItem(columnName)
+        self.dialog.dismiss()
+
+    def columnClicked(self, colName):
+        selectedTags = self.tagModel.selectedTags
+        if not selectedTags:
+            self.openConfigureColumnPopup(colName)
+        else:
+            if len(selectedTags) == 1:
+                text = "Добавить тег \"%s\" к столбцу \"%s\"?" % (next(iter(selectedTags)), colName)
+            else:
+                text = "Добавить %d тегов к столбцу \"%s\"?" % (len(selectedTags), colName)
+            self.dialog = MDDialog(
+                text=text,
+                buttons=[
+                    MDFlatButton(
+                        text="Отмена",
+                        theme_text_color="Custom",
+                        text_color=self.theme_cls.primary_color,
+                        on_press=lambda x: self.dialog.dismiss(),
+                    ),
+                    MDFlatButton(
+                        text="OK",
+                        theme_text_color="Custom",
+                        text_color=self.theme_cls.primary_color,
+                        on_press=lambda x: self.addTagToColumn(colName),
+                    ),
+                ],
+            )
+            self.dialog.open()
+        return True
+
+    def delColumn(self, colName):
+        with self.store.transaction(), self.tagModel.batch():
+            self.store.addUnused(self.tagModel.deleteColumn(colName))
+            self.store.delColumn(colName)
+        self.removeColumnItem(colName)
+
+        self.confirmDialog.dismiss()
+        self.dialog.dismiss()
+
+    def showConfirmDialog(self, txt, callback):
+        self.confirmDialog = MDDialog(
+            text=txt,
+            buttons=[
+                MDFlatButton(
+                    text="Отмена",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.confirmDialog.dismiss(),
+                ),
+                MDFlatButton(
+                    text="OK",
+                    on_press=lambda x: callback()
+                )
+            ],
+        )
+        self.confirmDialog.open()
+
+    def showErrDialog(self, txt):
+        self.errDialog = MDDialog(
+            text=txt,
+            buttons=[
+                MDFlatButton(
+                    text="Ok",
+                    on_press=lambda x: self.errDialog.dismiss()
+                )
+            ],
+        )
+        self.errDialog.open()
+
+    def selectTag(self, tag):
+        modifiers = Window.modifiers
+        anchorIdx = self.unusedTagsContainer.indexOf(self.tagModel.anchorTag)
+        if "shift" in modifiers and anchorIdx is not None:
+            texts = self.unusedTagsContainer.getVisibleTexts()
+            start, end = sorted((anchorIdx, self.unusedTagsContainer.indexOf(tag)))
+            rangeTags = [text for text in texts[start:end + 1] if self.tagModel.getState(text) == tagmodel.NEW]
+            changed = self.tagModel.select(rangeTags, add="ctrl" in modifiers or "meta" in modifiers)
+        elif "ctrl" in modifiers or "meta" in modifiers:
+            changed = self.tagModel.toggleSelected(tag)
+            self.tagModel.anchorTag = tag
+        elif self.tagModel.selectedTags == {tag}:
+            changed = self.tagModel.clearSelection()
+        else:
+            changed = self.tagModel.select([tag])
+            self.tagModel.anchorTag = tag
+        self.refreshSelection(changed)
+        return True
+
+    def selectAllFiltered(self):
+        visibleNew = [text for text in self.unusedTagsContainer.getVisibleTexts()
+                      if self.tagModel.getState(text) == tagmodel.NEW]
+        if visibleNew and self.tagModel.selectedTags.issuperset(visibleNew):
+            changed = self.tagModel.clearSelection()
+        else:
+            changed = self.tagModel.select(visibleNew, add=True)
+        self.refreshSelection(changed)
+
+    def refreshSelection(self, tags):
+        self.unusedTagsContainer.updateItems({tag: self.makeUnusedItem(tag) for tag in tags
+                                              if tag in self.unusedTagsContainer})
+
+    def addTagToColumn(self, colName):
+        tags = list(self.tagModel.selectedTags)
+        with self.store.transaction(), self.tagModel.batch():
+            self.store.removeUnused(self.tagModel.assign(tags, colName))
+            self.store.addColumnTags(colName, tags)
+        self.dialog.dismiss()
+        return True
+
+    def askMarkUnused(self):
+        if not self.tagModel.selectedTags:
+            self.showErrDialog("Сначала выбери теги")
+            return
+        self.showConfirmDialog("Отметить %d тегов как ненужные?" % len(self.tagModel.selectedTags),
+                               self.markSelectedUnused)
+
+    def markSelectedUnused(self):
+        with self.store.transaction(), self.tagModel.batch():
+            self.store.addUnused(self.tagModel.markUnused(list(self.tagModel.selectedTags)))
+        self.confirmDialog.dismiss()
+
+    def loadFile(self, filePath: str):
+        if engine.isSupportedPath(filePath):
+            self.runJob("load", "Открываю файл",
+                        lambda job: engine.getSheetColumns(filePath),
+                        lambda sheetColumns: self.fileLoaded(filePath, sheetColumns))
+
+    def fileLoaded(self, filePath, sheetColumns):
+        self.sheetColumns = sheetColumns
+        self.scans = dict()
+        self.listsContainer = None
+        self.filePath = filePath
+        self.prepareWorkspace()
+
+    def saveResults(self):
+        if not self.scans:
+            self.showErrDialog("Сначала прочитай теги")
+            return
+        mapping = engine.CompiledMapping(self.conf["used"])
+        scans = dict(self.scans)
+        self.runJob("save", "Сохраняю",
+                    lambda job: engine.saveTagColumns(self.filePath, list(scans), mapping,
+                                                      progress=job.progress, scans=scans),
+                    self.resultsSaved,
+                    cancellable=True)
+
+    def resultsSaved(self, outPath):
+        self.store.addUnused(self.tagModel.commitNewTags())
+
+        self.dialog = MDDialog(
+            text="Готово!",
+            buttons=[
+                MDFlatButton(
+                    text="OK",
+                    theme_text_color="Custom",
+                    text_color=self.theme_cls.primary_color,
+                    on_press=lambda x: self.dialog.dismiss(),
+                ),
+            ],
+        )
+        self.dialog.open()
+
+    def build(self):
+        Window.bind(on_drop_file=lambda window, file, x, y: self.loadFile(file.decode("utf-8")))
+        return self.mainWidget
+
+    def on_stop(self):
+        profiling.writeTraceFromEnv()
+
@@ -0,0 +1,7 @@
+import sys
+
+from tagsparser import batch
+
+
+if __name__ == '__main__':
+    sys.exit(batch.main())
@@ -0,0 +1,50 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from openpyxl import Workbook
+
+TAG_COLUMN = "B"
+
+
+def makeVocabulary(size):
+    return ["tag%05d" % num for num in range(size)]
+
+
+def makeConfig(vocabularySize, columnCount, assignedShare=0.8):
+    vocabulary = makeVocabulary(vocabularySize)
+    assignedCount = int(vocabularySize * assignedShare)
+    conf = {"unused": set(vocabulary[assignedCount:]), "used": {}}
+    for colNum in range(columnCount):
+        conf["used"]["Колонка %d" % colNum] = {"default": "-",
+                                               "multiple": "[all]" if colNum % 2 else "несколько",
+                                               "all": set()}
+    columns = list(conf["used"].values())
+    for num, tag in enumerate(vocabulary[:assignedCount]):
+        columns[num % columnCount]["all"].add(tag)
+    return conf
+
+
+def makeWorkbook(filePath, rows, tagsPerCell, vocabularySize, seed=0):
+    rnd = random.Random(seed)
+    vocabulary = makeVocabulary(vocabularySize)
+    xlFile = Workbook(write_only=True)
+    xlSheet = xlFile.create_sheet("Sheet")
+    xlSheet.append(["Артикул", "Теги", "Название", "Цена"])
+    for rowNum in range(rows):
+        tags = ", ".join(rnd.choice(vocabulary) for _ in range(rnd.randint(1, tagsPerCell * 2 - 1)))
+        xlSheet.append([rowNum, tags, "Товар %d" % rowNum, rnd.randint(1, 10000)])
+    tmpPath = filePath + ".part"
+    xlFile.save(tmpPath)
+    os.replace(tmpPath, filePath)
+    return filePath
+
+
+def getWorkbook(dataDir, rows, tagsPerCell, vocabularySize):
+    os.makedirs(dataDir, exist_ok=True)
+    filePath = os.path.join(dataDir, "bench_%d_%d_%d.xlsx" % (rows, tagsPerCell, vocabularySize))
+    if not os.path.exists(filePath):
+        makeWorkbook(filePath, rows, tagsPerCell, vocabularySize)
+    return filePath
@@ -0,0 +1,183 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import queue
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tagsparser import engine, mappingstore, scancache
+from tagsparser.profiling import getPeakRssKb
+from benchmarks.generate import TAG_COLUMN, getWorkbook, makeConfig
+
+
+class PhaseTimer:
+    # ru_maxrss only ever grows, so the peak before the timed region is kept to report the phase's own growth
+
+    def __init__(self):
+        self.seconds = 0
+        self.cpuSeconds = 0
+        self.baselineRssKb = None
+
+    def __enter__(self):
+        if self.baselineRssKb is None:
+            self.baselineRssKb = getPeakRssKb()
+        self.started = time.perf_counter()
+        self.cpuStarted = time.process_time()
+        return self
+
+    def __exit__(self, *excInfo):
+        self.seconds += time.perf_counter() - self.started
+        self.cpuSeconds += time.process_time() - self.cpuStarted
+
+
+def loadScan(filePath):
+    # classify and save start from the scan cache prepared by the parent, not from a fresh scan
+    scan = engine.TagColumnScan.loadCache(filePath, TAG_COLUMN)
+    if scan is None:
+        raise RuntimeError("нет подготовленного скана для %s" % filePath)
+    return scan
+
+
+def prepareScan(filePath):
+    engine.scanTagColumn(filePath, TAG_COLUMN)
+
+
+def benchScan(case, filePath, workDir, timer):
+    with timer:
+        scan = engine.scanTagColumn(filePath, TAG_COLUMN, useCache=False)
+    return scan.rowCount
+
+
+def benchClassify(case, filePath, workDir, timer):
+    scan = loadScan(filePath)
+    used = makeConfig(case["vocabulary"], case["columns"])["used"]
+    with timer:
+        mapping = engine.CompiledMapping(used)
+        for rowIdx in range(scan.rowCount):
+            mapping.classify(scan.rowTags(rowIdx))
+    return scan.rowCount
+
+
+def benchSave(case, filePath, workDir, timer):
+    # a full save: no manifest is hashed or written, and no earlier output is patched
+    scan = loadScan(filePath)
+    used = makeConfig(case["vocabulary"], case["columns"])["used"]
+    with timer:
+        engine.saveTagColumns(filePath, [(None, TAG_COLUMN)], used, outPath=os.path.join(workDir, "out.xlsx"),
+                              scans={(None, TAG_COLUMN): scan}, incremental=False)
+    return scan.rowCount
+
+
+def benchConfig(case, filePath, workDir, timer):
+    conf = makeConfig(case["vocabulary"], case["columns"])
+    configPath = os.path.join(workDir, "config.json")
+    store = mappingstore.MappingStore(os.path.join(workDir, "mapping.db"))
+    with timer:
+        engine.saveConfig(conf, configPath)
+        engine.loadConfig(configPath)
+        store.importConfig(conf)
+        store.load()
+    store.close()
+    return case["vocabulary"]
+
+
+PHASES = {"scan": benchScan,
+          "classify": benchClassify,
+          "save": benchSave,
+          "config": benchConfig}
+CACHED_SCAN_PHASES = ("classify", "save")
+
+
+def runPhase(phase, case, filePath, cacheDir, results):
+    try:
+        results.put(measurePhase(phase, case, filePath, cacheDir))
+    except Exception as e:
+        results.put({"error": "%s: %s" % (type(e).__name__, e)})
+
+
+def measurePhase(phase, case, filePath, cacheDir):
+    scancache.defaultCache = scancache.ScanCache(cacheDir)
+    scancache.defaultCachePid = os.getpid()
+    timer = PhaseTimer()
+    with tempfile.TemporaryDirectory() as workDir:
+        count = PHASES[phase](case, filePath, workDir, timer)
+    peakRssKb = getPeakRssKb()
+    # peakRssKb is the whole process's high-water mark (interpreter, imports and loaded scan included),
+    # peakRssDeltaKb is how far the timed region pushed it past what was reached before it;
+    # both are None where the platform does not report it
+    hasRss = peakRssKb is not None and timer.baselineRssKb is not None
+    return {"unit": "tags" if phase == "config" else "rows",
+            "seconds": timer.seconds,
+            "cpuSeconds": timer.cpuSeconds,
+            "items": count,
+            "itemsPerSec": count / timer.seconds if timer.seconds else None,
+            "peakRssKb": peakRssKb,
+            "baselineRssKb": timer.baselineRssKb,
+            "peakRssDeltaKb": peakRssKb - timer.baselineRssKb if hasRss else None}
+
+
+def measure(phase, case, filePath, cacheDir):
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=runPhase, args=(phase, case, filePath, cacheDir, results))
+    process.start()
+    try:
+        # the child may die without reporting anything, so it is checked on while waiting
+        while True:
+            try:
+                return results.get(timeout=1)
+            except queue.Empty:
+                if not process.is_alive():
+                    try:
+                        return results.get(timeout=1)
+                    except queue.Empty:
+                        return {"error": "процесс замера завершился с кодом %s" % process.exitcode}
+    finally:
+        process.join()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости чтения, классификации и сохранения")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--tags-per-cell", type=int, nargs="+", default=[3])
+    parser.add_argument("--vocabulary", type=int, nargs="+", default=[1000, 20000])
+    parser.add_argument("--columns", type=int, nargs="+", default=[10, 60])
+    parser.add_argument("--phases", nargs="+", choices=sorted(PHASES), default=list(PHASES))
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "tagsparser-bench"),
+                        help="куда складывать сгенерированные книги, они переиспользуются между запусками")
+    parser.add_argument("-o", "--output", help="файл для результатов в формате JSON Lines, по умолчанию stdout")
+    args = parser.parse_args(argv)
+    cacheDir = os.path.join(args.data_dir, "scan-cache")
+    scancache.defaultCache = scancache.ScanCache(cacheDir)
+    scancache.defaultCachePid = os.getpid()
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for rows, tagsPerCell, vocabulary, columns in itertools.product(args.rows, args.tags_per_cell,
+                                                                        args.vocabulary, args.columns):
+            case = {"rows": rows, "tagsPerCell": tagsPerCell, "vocabulary": vocabulary, "columns": columns}
+            filePath = getWorkbook(args.data_dir, rows, tagsPerCell, vocabulary)
+            if any(phase in CACHED_SCAN_PHASES for phase in args.phases):
+                prepareScan(filePath)
+            for phase in args.phases:
+                record = {"phase": phase,
+                          "case": case,
+                          "python": platform.python_version(),
+                          "timestamp": time.time()}
+                record.update(measure(phase, case, filePath, cacheDir))
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
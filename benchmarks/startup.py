@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# each target is imported in a fresh interpreter, so the numbers are cold-start costs
+TARGETS = {"engine": "import tagsparser.engine, tagsparser.mappingstore, tagsparser.tagmodel",
+           "engine+openpyxl": "import tagsparser.engine; import openpyxl.reader.excel",
+           "batch": "import tagsparser.batch",
+           "gui": "import app"}
+
+MEASURE_CODE = """
+import json, time
+started = time.perf_counter()
+%s
+print(json.dumps({"seconds": time.perf_counter() - started}))
+"""
+
+
+def measure(target, runs):
+    times = []
+    for _ in range(runs):
+        result = subprocess.run([sys.executable, "-c", MEASURE_CODE % TARGETS[target]],
+                                cwd=ROOT, capture_output=True, text=True,
+                                env=dict(os.environ, KIVY_NO_ARGS="1", KIVY_NO_CONSOLELOG="1"))
+        if result.returncode != 0:
+            return {"error": result.stderr.strip().splitlines()[-1] if result.stderr.strip() else "failed"}
+        times.append(json.loads(result.stdout.strip().splitlines()[-1])["seconds"])
+    return {"seconds": min(times), "medianSeconds": statistics.median(times), "runs": runs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замер времени холодного старта движка и интерфейса")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=list(TARGETS))
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("-o", "--output", help="файл для результатов в формате JSON Lines, по умолчанию stdout")
+    args = parser.parse_args(argv)
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for target in args.targets:
+            record = {"phase": "startup",
+                      "target": target,
+                      "python": platform.python_version(),
+                      "timestamp": time.time()}
+            record.update(measure(target, args.runs))
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+    finally:
+        if args.output:
+            output.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,64 @@
+import threading
+import time
+
+from kivy.clock import Clock
+
+from tagsparser import profiling
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+    PROGRESS_INTERVAL = 0.1
+
+    def __init__(self, name, target, onDone=None, onError=None, onCancelled=None, onProgress=None):
+        self.name = name
+        self.target = target
+        self.onDone = onDone
+        self.onError = onError
+        self.onCancelled = onCancelled
+        self.onProgress = onProgress
+        self.cancelEvent = threading.Event()
+        self.thread = None
+        self.startTime = None
+        self.lastProgressTime = 0
+
+    @property
+    def cancelled(self):
+        return self.cancelEvent.is_set()
+
+    def start(self):
+        self.startTime = time.perf_counter()
+        self.thread = threading.Thread(target=self.run, name=self.name, daemon=True)
+        self.thread.start()
+        return self
+
+    def cancel(self):
+        self.cancelEvent.set()
+
+    def progress(self, rowsDone, rowsTotal=None):
+        if self.cancelled:
+            raise JobCancelled()
+        now = time.perf_counter()
+        if self.onProgress and now - self.lastProgressTime >= self.PROGRESS_INTERVAL:
+            self.lastProgressTime = now
+            rowsPerSec = rowsDone / max(now - self.startTime, 1e-9)
+            self.schedule(self.onProgress, rowsDone, rowsTotal, rowsPerSec)
+
+    def run(self):
+        try:
+            with profiling.profiled(self.name), profiling.phase("job." + self.name):
+                result = self.target(self)
+        except JobCancelled:
+            self.schedule(self.onCancelled)
+        except Exception as e:
+            self.schedule(self.onError, e)
+        else:
+            self.schedule(self.onDone, result)
+
+    @staticmethod
+    def schedule(callback, *args):
+        if callback:
+            Clock.schedule_once(lambda dt: callback(*args))
@@ -0,0 +1,100 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import engine, mappingstore, profiling, rules
+
+
+def expandFiles(patterns):
+    files = []
+    for pattern in patterns:
+        matched = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        for filePath in matched:
+            root = os.path.splitext(filePath)[0]
+            if engine.isSupportedPath(filePath) and not root.endswith("_updated") and filePath not in files:
+                files.append(filePath)
+    return files
+
+
+def processFile(filePath, sources, conf, profilePrefix=None):
+    profiling.tracer.clear()
+    started = time.perf_counter()
+    seenTags = set()
+    with profiling.profiled(os.path.basename(filePath), profilePrefix), profiling.phase("batch.file", file=filePath):
+        scans = dict()
+        for sheet, column in sources:
+            scan = engine.TagColumnScan.loadCache(filePath, column, sheet)
+            if scan:
+                scans[(sheet, column)] = scan
+        outPath = engine.saveTagColumns(filePath, sources, conf["used"], seenTags=seenTags, scans=scans)
+    matcher = rules.RuleMatcher.fromUsed(conf["used"])
+    newTags = {tag for tag in seenTags.difference(engine.getAllTagsSet(conf)) if not matcher.match(tag)}
+    return outPath, newTags, time.perf_counter() - started, list(profiling.tracer.records)
+
+
+def runBatch(configPath, sources, files, workers=None, updateConfig=False, profilePrefix=None):
+    conf = mappingstore.loadMapping(configPath)
+    allNewTags = set()
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(processFile, filePath, sources, conf, profilePrefix): filePath for filePath in files}
+        for future in as_completed(futures):
+            filePath = futures[future]
+            try:
+                outPath, newTags, elapsed, records = future.result()
+            except Exception as e:
+                failed.append(filePath)
+                print("%s: ошибка: %s" % (filePath, e), file=sys.stderr)
+                continue
+            allNewTags.update(newTags)
+            profiling.tracer.merge(records)
+            print("%s -> %s (%.1f с, новых тегов: %d)" % (filePath, outPath, elapsed, len(newTags)))
+
+    if updateConfig and allNewTags:
+        if configPath.endswith(".json"):
+            conf["unused"].update(allNewTags)
+            engine.saveConfig(conf, configPath)
+        else:
+            store = mappingstore.MappingStore(configPath)
+            try:
+                store.addUnused(allNewTags)
+            finally:
+                store.close()
+    return allNewTags, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разложить теги по колонкам без GUI")
+    parser.add_argument("config", help="путь к config.json или mapping.db")
+    parser.add_argument("columns", help="колонки с тегами через запятую: B или Лист!B,Доп. теги!C; "
+                                        "без имени листа берётся первый лист")
+    parser.add_argument("files", nargs="+", help="файлы .xlsx/.csv/.tsv или маски вида data/*.xlsx")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="число параллельных процессов")
+    parser.add_argument("--update-config", action="store_true",
+                        help="добавить найденные новые теги в unused, как это делает кнопка «Сохранить»")
+    parser.add_argument("--trace", default=os.environ.get(profiling.TRACE_ENV),
+                        help="записать замеры по этапам в JSON (открывается и в chrome://tracing)")
+    parser.add_argument("--profile", default=os.environ.get(profiling.PROFILE_ENV),
+                        help="префикс для файлов cProfile, по одному на каждый обработанный файл")
+    args = parser.parse_args(argv)
+
+    files = expandFiles(args.files)
+    if not files:
+        parser.error("не найдено ни одного файла .xlsx, .csv или .tsv")
+    sources = list(dict.fromkeys(engine.parseSource(source) for source in args.columns.split(",")))
+    allNewTags, failed = runBatch(args.config, sources, files,
+                                  workers=args.workers, updateConfig=args.update_config,
+                                  profilePrefix=args.profile)
+    if args.trace:
+        profiling.tracer.writeTrace(args.trace)
+    print("Обработано файлов: %d, с ошибками: %d, новых тегов: %d"
+          % (len(files) - len(failed), len(failed), len(allNewTags)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
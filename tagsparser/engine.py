@@ -0,0 +1,735 @@
+import codecs
+import csv
+import itertools
+import json
+import os
+import random
+import sqlite3
+import sys
+import zipfile
+from array import array
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import profiling, rules, scancache
+
+
+PROGRESS_STEP = 1000
+CSV_EXTENSIONS = (".csv", ".tsv")
+CSV_SAMPLE_SIZE = 64 * 1024
+CSV_FALLBACK_ENCODING = "cp1251"
+PREVIEW_ROWS = 200
+MANIFEST_VERSION = 1
+EMPTY = "empty"
+DEFAULT = "default"
+SINGLE = "single"
+MULTIPLE = "multiple"
+
+csv.field_size_limit(2 ** 31 - 1)
+
+
+@profiling.traced("config.load")
+def loadConfig(configPath="config.json"):
+    if not os.path.exists(configPath):
+        return {"unused": set(),
+                "used": {}}  # {columnName: {default: value,
+        #                                    multiple: value,
+        #                                    all: []}}
+    with open(configPath, "r") as cfg:
+        conf = json.loads(cfg.read())
+    conf["unused"] = set(conf["unused"])
+    for col in conf["used"].values():
+        col["all"] = set(col["all"])
+        col.setdefault("rules", [])
+    return conf
+
+
+@profiling.traced("config.save")
+def saveConfig(conf, configPath="config.json"):
+    config = {"unused": list(conf["unused"]), "used": dict()}
+    for col, colData in conf["used"].items():
+        config["used"][col] = {"default": colData["default"],
+                               "multiple": colData["multiple"],
+                               "all": list(colData["all"]),
+                               "rules": list(colData.get("rules", []))}
+    with open(configPath, "w") as cfg:
+        cfg.write(json.dumps(config))
+
+
+def getAllTagsSet(conf):
+    tagsSet = set()
+    tagsSet.update(conf["unused"])
+    for colData in conf["used"].values():
+        tagsSet.update(colData["all"])
+    return tagsSet
+
+
+def splitTags(cellVal):
+    if not cellVal:
+        return []
+    if not isinstance(cellVal, str):
+        cellVal = str(cellVal)
+    return [tag for tag in map(str.strip, cellVal.replace("\n", " ").split(",")) if tag]
+
+
+def isCsvPath(filePath):
+    return os.path.splitext(filePath)[1].lower() in CSV_EXTENSIONS
+
+
+def isSupportedPath(filePath):
+    return isCsvPath(filePath) or os.path.splitext(filePath)[1].lower() == ".xlsx"
+
+
+def detectCsvFormat(filePath):
+    with open(filePath, "rb") as csvFile:
+        sample = csvFile.read(CSV_SAMPLE_SIZE)
+
+    if sample.startswith(codecs.BOM_UTF8):
+        encoding = "utf-8-sig"
+    elif sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        encoding = "utf-16"
+    else:
+        try:
+            codecs.getincrementaldecoder("utf-8")().decode(sample, final=len(sample) < CSV_SAMPLE_SIZE)
+            encoding = "utf-8"
+        except UnicodeDecodeError:
+            encoding = CSV_FALLBACK_ENCODING
+
+    text = sample.decode(encoding, errors="ignore")
+    if os.path.splitext(filePath)[1].lower() == ".tsv":
+        delimiter = "\t"
+    else:
+        try:
+            delimiter = csv.Sniffer().sniff(text[:text.rfind("\n") + 1] or text, delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+    return encoding, delimiter
+
+
+def iterCsvRows(filePath, csvFormat=None):
+    encoding, delimiter = csvFormat or detectCsvFormat(filePath)
+    with open(filePath, "r", encoding=encoding, newline="") as csvFile:
+        yield from csv.reader(csvFile, delimiter=delimiter)
+
+
+def formatSource(source):
+    sheet, column = source
+    return "%s!%s" % (sheet, column) if sheet else column
+
+
+def parseSource(text):
+    sheet, _, column = text.rpartition("!")
+    return sheet or None, column.strip().upper()
+
+
+def getColumnIndex(column):
+    if not column.isascii() or not column.isalpha() or len(column) > 3:
+        raise ValueError("Неверное имя колонки \"%s\"" % column)
+    colIdx = 0
+    for char in column.upper():
+        colIdx = colIdx * 26 + ord(char) - ord("A") + 1
+    return colIdx
+
+
+def getColumnLetter(colIdx):
+    letters = ""
+    while colIdx:
+        colIdx, rem = divmod(colIdx - 1, 26)
+        letters = chr(ord("A") + rem) + letters
+    return letters
+
+
+def loadWorkbook(filePath, **kwargs):
+    # openpyxl is most of the import time and csv files never need it
+    from openpyxl.reader.excel import load_workbook
+    return load_workbook(filename=filePath, **kwargs)
+
+
+def newWorkbook(**kwargs):
+    from openpyxl import Workbook
+    return Workbook(**kwargs)
+
+
+def getSheetColumns(filePath):
+    if isCsvPath(filePath):
+        header = next(iterCsvRows(filePath), [])
+        return {None: [getColumnLetter(col) for col in range(1, max(len(header), 1) + 1)]}
+
+    sheetColumns = dict()
+    xlFile = loadWorkbook(filePath, read_only=True)
+    try:
+        for xlSheet in xlFile.worksheets:
+            maxColumn = xlSheet.max_column
+            if not maxColumn:
+                xlSheet.calculate_dimension(force=True)
+                maxColumn = xlSheet.max_column or 1
+            sheetColumns[xlSheet.title] = [getColumnLetter(col) for col in range(1, maxColumn + 1)]
+        return sheetColumns
+    finally:
+        xlFile.close()
+
+
+def getSheet(xlFile, sheet):
+    return xlFile.worksheets[0] if sheet is None else xlFile[sheet]
+
+
+class TagColumnScan:
+    CACHE_VERSION = 2
+
+    def __init__(self, column, sheet=None):
+        self.column = column
+        self.sheet = sheet
+        self.vocabulary = []
+        self.tagIds = dict()
+        self.counts = array("I")
+        self.offsets = array("I", [0])
+        self.ids = array("I")
+        self.tagRows = None
+
+    @property
+    def rowCount(self):
+        return len(self.offsets) - 1
+
+    @property
+    def tags(self):
+        return set(self.vocabulary)
+
+    @property
+    def source(self):
+        return self.sheet, self.column
+
+    def addRow(self, tags):
+        for tag in dict.fromkeys(tags):
+            tagId = self.tagIds.get(tag)
+            if tagId is None:
+                tagId = self.tagIds[tag] = len(self.vocabulary)
+                self.vocabulary.append(sys.intern(tag))
+                self.counts.append(0)
+            self.counts[tagId] += 1
+            self.ids.append(tagId)
+        self.offsets.append(len(self.ids))
+
+    def rowTags(self, rowIdx):
+        vocabulary = self.vocabulary
+        return [vocabulary[tagId] for tagId in self.ids[self.offsets[rowIdx]:self.offsets[rowIdx + 1]]]
+
+    def getFrequencies(self):
+        return dict(zip(self.vocabulary, self.counts))
+
+    def getTagRows(self):
+        # row indexes per tag id, built on first use and kept with the scan for the next save
+        if self.tagRows is None:
+            tagRows = [array("I") for _ in self.vocabulary]
+            offsets = self.offsets
+            for rowIdx in range(self.rowCount):
+                for tagId in self.ids[offsets[rowIdx]:offsets[rowIdx + 1]]:
+                    tagRows[tagId].append(rowIdx)
+            self.tagRows = tagRows
+        return self.tagRows
+
+    def getRowsWithTags(self, tags):
+        tagRows = self.getTagRows()
+        rows = set()
+        for tag in tags:
+            tagId = self.tagIds.get(tag)
+            if tagId is not None:
+                rows.update(tagRows[tagId])
+        return rows
+
+    def writeTo(self, cache):
+        header = {"sheet": self.sheet,
+                  "column": self.column,
+                  "rows": self.rowCount,
+                  "ids": len(self.ids)}
+        cache.write(json.dumps(header).encode("utf-8") + b"\n")
+        cache.write(json.dumps(self.vocabulary, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.counts.tofile(cache)
+        self.offsets.tofile(cache)
+        self.ids.tofile(cache)
+
+    @classmethod
+    def readFrom(cls, cache):
+        header = json.loads(cache.readline())
+        scan = cls(header["column"], header["sheet"])
+        scan.vocabulary = [sys.intern(tag) for tag in json.loads(cache.readline())]
+        scan.tagIds = {tag: tagId for tagId, tag in enumerate(scan.vocabulary)}
+        scan.counts.fromfile(cache, len(scan.vocabulary))
+        scan.offsets = array("I")
+        scan.offsets.fromfile(cache, header["rows"] + 1)
+        scan.ids.fromfile(cache, header["ids"])
+        return scan
+
+    @classmethod
+    def loadCache(cls, filePath, column, sheet=None):
+        try:
+            cache = scancache.getCache()
+            entryPath = cache.get(cache.getKey(filePath, sheet, column, cls.CACHE_VERSION))
+            if not entryPath:
+                return None
+            with open(entryPath, "rb") as entryFile:
+                return cls.readFrom(entryFile)
+        except (OSError, ValueError, EOFError, KeyError, sqlite3.Error):
+            return None
+
+    def saveCache(self, filePath):
+        cache = scancache.getCache()
+        cache.put(cache.getKey(filePath, self.sheet, self.column, self.CACHE_VERSION), self.writeTo)
+
+
+def getDataRowCount(xlSheet):
+    return max(xlSheet.max_row - 1, 0) if xlSheet.max_row else None
+
+
+def scanTagColumn(filePath, column, progress=None, useCache=True, sheet=None):
+    if useCache:
+        with profiling.phase("scan.cacheLoad") as stats:
+            scan = TagColumnScan.loadCache(filePath, column, sheet)
+            stats["rows"] = scan.rowCount if scan else 0
+        if scan:
+            if progress:
+                progress(scan.rowCount, scan.rowCount)
+            return scan
+
+    colIdx = getColumnIndex(column)
+    scan = TagColumnScan(column, sheet)
+    if isCsvPath(filePath):
+        with profiling.phase("scan.rows") as stats:
+            rows = iterCsvRows(filePath)
+            next(rows, None)
+            for row in rows:
+                scan.addRow(splitTags(row[colIdx - 1]) if len(row) >= colIdx else [])
+                if progress and scan.rowCount % PROGRESS_STEP == 0:
+                    progress(scan.rowCount, None)
+            stats["rows"] = scan.rowCount
+    else:
+        with profiling.phase("scan.open"):
+            xlFile = loadWorkbook(filePath, read_only=True)
+        try:
+            with profiling.phase("scan.rows") as stats:
+                xlSheet = getSheet(xlFile, sheet)
+                rowsTotal = getDataRowCount(xlSheet)
+                for (cellVal,) in xlSheet.iter_rows(min_row=2, min_col=colIdx, max_col=colIdx, values_only=True):
+                    scan.addRow(splitTags(cellVal))
+                    if progress and scan.rowCount % PROGRESS_STEP == 0:
+                        progress(scan.rowCount, rowsTotal)
+                stats["rows"] = scan.rowCount
+        finally:
+            xlFile.close()
+    if progress:
+        progress(scan.rowCount, scan.rowCount)
+    if useCache:
+        try:
+            with profiling.phase("scan.cacheSave", rows=scan.rowCount):
+                scan.saveCache(filePath)
+        except (OSError, sqlite3.Error):
+            pass
+    return scan
+
+
+def scanSources(filePath, sources, progress=None, useCache=True, workers=None):
+    scans = dict()
+    pending = []
+    for sheet, column in sources:
+        scan = TagColumnScan.loadCache(filePath, column, sheet) if useCache else None
+        if scan:
+            scans[(sheet, column)] = scan
+        else:
+            pending.append((sheet, column))
+
+    rowsDone = sum(scan.rowCount for scan in scans.values())
+    if len(pending) == 1:
+        sheet, column = pending[0]
+        if progress:
+            def scanProgress(rows, rowsTotal):
+                progress(rowsDone + rows, rowsTotal and rowsDone + rowsTotal)
+        else:
+            scanProgress = None
+        scan = scans[(sheet, column)] = scanTagColumn(filePath, column, scanProgress, useCache, sheet)
+        rowsDone += scan.rowCount
+    elif pending:
+        with profiling.phase("scan.parallel", sources=len(pending)) as stats, \
+                ProcessPoolExecutor(max_workers=min(workers or os.cpu_count() or 1, len(pending))) as pool:
+            futures = {pool.submit(scanTagColumn, filePath, column, None, useCache, sheet): (sheet, column)
+                       for sheet, column in pending}
+            notDone = set(futures)
+            try:
+                while notDone:
+                    done, notDone = wait(notDone, timeout=0.2, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        scan = scans[futures[future]] = future.result()
+                        rowsDone += scan.rowCount
+                    if progress:
+                        progress(rowsDone, None)
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            stats["rows"] = rowsDone
+    if progress:
+        progress(rowsDone, rowsDone)
+    return {source: scans[source] for source in sources}
+
+
+class CompiledMapping:
+
+    def __init__(self, used):
+        self.used = {colName: {"default": colData["default"],
+                               "multiple": colData["multiple"],
+                               "all": list(colData["all"]),
+                               "rules": list(colData.get("rules", []))}
+                     for colName, colData in used.items()}
+        self.columnNames = list(used.keys())
+        self.defaults = [colData["default"] for colData in used.values()]
+        self.multiples = [colData["multiple"] for colData in used.values()]
+        self.emptyValues = [None] * len(self.columnNames)
+        self.tagColumns = dict()
+        for colIdx, colData in enumerate(used.values()):
+            for tag in colData["all"]:
+                tag = sys.intern(tag)
+                self.tagColumns[tag] = self.tagColumns.get(tag, ()) + (colIdx,)
+        self.matcher = rules.RuleMatcher.fromUsed(used)
+        self.ruledColumns = dict()
+
+    def getColumns(self, tag):
+        columns = self.ruledColumns.get(tag)
+        if columns is None:
+            columns = self.tagColumns.get(tag, ())
+            ruled = self.matcher.match(tag)
+            if ruled:
+                columns = tuple(sorted(set(columns).union(ruled)))
+            self.ruledColumns[tag] = columns
+        return columns
+
+    def lookup(self, tag):
+        return self.tagColumns.get(tag, ()) if self.matcher.empty else self.getColumns(tag)
+
+    def getHits(self, tags):
+        hits = dict()
+        for tag in tags:
+            for colIdx in self.lookup(tag):
+                hits.setdefault(colIdx, []).append(tag)
+        return hits
+
+    def classify(self, tags, hits=None):
+        if hits is None:
+            hits = self.getHits(tags)
+        values = list(self.defaults)
+        for colIdx, found in hits.items():
+            if len(found) == 1:
+                values[colIdx] = found[0]
+            elif self.multiples[colIdx] == "[all]":
+                values[colIdx] = ", ".join(found)
+            else:
+                values[colIdx] = self.multiples[colIdx]
+        return values
+
+    def derive(self, tags):
+        # a row without tags gets empty cells, not the defaults
+        return self.classify(tags) if tags else self.emptyValues
+
+    def classifyKinds(self, tags):
+        if not tags:
+            return self.emptyValues, [EMPTY] * len(self.columnNames)
+        hits = self.getHits(tags)
+        kinds = [DEFAULT] * len(self.columnNames)
+        for colIdx, found in hits.items():
+            kinds[colIdx] = SINGLE if len(found) == 1 else MULTIPLE
+        return self.classify(tags, hits), kinds
+
+
+def previewClassification(scans, used, rowLimit=PREVIEW_ROWS, sample=False):
+    # works on the scans already in memory: nothing is read from or written to disk
+    mapping = CompiledMapping(used)
+    preview = {"columnNames": mapping.columnNames, "rows": [], "summary": dict()}
+    rowLimit = max(0, rowLimit)
+    for source, scan in scans.items():
+        if sample:
+            rowIdxs = sorted(random.sample(range(scan.rowCount), min(rowLimit, scan.rowCount)))
+        else:
+            rowIdxs = range(min(rowLimit, scan.rowCount))
+        summary = preview["summary"][source] = [dict.fromkeys((EMPTY, DEFAULT, SINGLE, MULTIPLE), 0)
+                                                for _ in mapping.columnNames]
+        for rowIdx in rowIdxs:
+            tags = scan.rowTags(rowIdx)
+            values, kinds = mapping.classifyKinds(tags)
+            for colIdx, kind in enumerate(kinds):
+                summary[colIdx][kind] += 1
+            preview["rows"].append({"rowNum": rowIdx + 2, "source": source, "tags": tags, "values": values})
+    return preview
+
+
+def getUpdatedPath(filePath):
+    root, ext = os.path.splitext(filePath)
+    return root + "_updated" + ext
+
+
+class RowDeriver:
+
+    def __init__(self, mapping, seenTags=None, progress=None):
+        self.mapping = mapping
+        self.seenTags = seenTags
+        self.progress = progress
+        self.rowsDone = 0
+
+    def derive(self, rows, columns, rowsTotal=None):
+        # columns: [(column letter, scan or None)]; derived values go in from the rightmost column
+        # so the positions of the columns to the left stay valid
+        columns = sorted(((getColumnIndex(column), scan) for column, scan in columns), reverse=True)
+        maxColIdx = columns[0][0]
+        rows = iter(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        header = list(header)
+        header.extend([None] * (maxColIdx - len(header)))
+        for colIdx, scan in columns:
+            header[colIdx:colIdx] = self.mapping.columnNames
+        yield header
+
+        # rows are classified a batch at a time, so that work gets its own phase between reading and writing
+        rowsRead = 0
+        while True:
+            batch = [list(row) for row in itertools.islice(rows, PROGRESS_STEP)]
+            if not batch:
+                break
+            with profiling.phase("save.classify", rows=len(batch)):
+                for rowIdx, row in enumerate(batch, start=rowsRead):
+                    if len(row) < maxColIdx:
+                        row.extend([None] * (maxColIdx - len(row)))
+                    for colIdx, scan in columns:
+                        if scan and rowIdx < scan.rowCount:
+                            tags = scan.rowTags(rowIdx)
+                        else:
+                            tags = dict.fromkeys(splitTags(row[colIdx - 1]))
+                        if self.seenTags is not None:
+                            self.seenTags.update(tags)
+                        row[colIdx:colIdx] = self.mapping.derive(tags)
+            rowsRead += len(batch)
+            self.rowsDone += len(batch)
+            if self.progress:
+                self.progress(self.rowsDone, rowsTotal)
+            yield from batch
+
+
+def groupSourcesBySheet(sources, scans):
+    sheetColumns = dict()
+    for source in sources:
+        sheet, column = source
+        sheetColumns.setdefault(sheet, []).append((column, scans.get(source)))
+    return sheetColumns
+
+
+def saveXlsxRows(filePath, outPath, deriver, sheetColumns):
+    with profiling.phase("save.open"):
+        srcFile = loadWorkbook(filePath, read_only=True)
+        dstFile = newWorkbook(write_only=True)
+    try:
+        if None in sheetColumns:
+            sheetColumns = dict(sheetColumns)
+            sheetColumns.setdefault(srcFile.worksheets[0].title, []).extend(sheetColumns.pop(None))
+        rowsTotal = 0
+        for srcSheet in srcFile.worksheets:
+            if srcSheet.title in sheetColumns:
+                rowsTotal += getDataRowCount(srcSheet) or 0
+
+        with profiling.phase("save.rows") as stats:
+            for srcSheet in srcFile.worksheets:
+                dstSheet = dstFile.create_sheet(title=srcSheet.title)
+                rows = srcSheet.iter_rows(values_only=True)
+                if srcSheet.title in sheetColumns:
+                    rows = deriver.derive(rows, sheetColumns[srcSheet.title], rowsTotal or None)
+                for row in rows:
+                    dstSheet.append(row)
+            stats["rows"] = deriver.rowsDone
+        with profiling.phase("save.write", rows=deriver.rowsDone):
+            dstFile.save(outPath)
+    finally:
+        srcFile.close()
+
+
+def checkCsvEncoding(mapping, encoding):
+    # tags come from the file itself, but column names and the fixed values are typed in the app
+    # and may not fit a legacy encoding; this fails before anything is written
+    for value in mapping.columnNames + mapping.defaults + mapping.multiples:
+        try:
+            str(value).encode(encoding)
+        except UnicodeEncodeError:
+            raise ValueError("\"%s\" нельзя записать в кодировке файла %s" % (value, encoding))
+
+
+def saveCsvRows(filePath, outPath, deriver, sheetColumns):
+    encoding, delimiter = csvFormat = detectCsvFormat(filePath)
+    columns = [column for sheetCols in sheetColumns.values() for column in sheetCols]
+    with profiling.phase("save.rows") as stats:
+        with open(outPath, "w", encoding=encoding, newline="") as csvFile:
+            writer = csv.writer(csvFile, delimiter=delimiter)
+            writer.writerows(deriver.derive(iterCsvRows(filePath, csvFormat), columns))
+        stats["rows"] = deriver.rowsDone
+
+
+def getManifestPath(outPath):
+    outDir, outName = os.path.split(outPath)
+    return os.path.join(outDir, "." + outName + ".manifest.json")
+
+
+def getStatKey(filePath):
+    # (size, mtime) to tell whether a file changed, or None once it is gone
+    try:
+        stat = os.stat(filePath)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def writeManifest(filePath, outPath, sources, mapping):
+    # records what the output was derived from, so the next save can tell which rows changed
+    try:
+        sourceHash = scancache.getCache().getFileHash(filePath)
+    except (OSError, sqlite3.Error):
+        return
+    manifest = {"version": MANIFEST_VERSION,
+                "sourceHash": sourceHash,
+                "sources": [list(source) for source in sources],
+                "used": mapping.used,
+                "output": list(getStatKey(outPath) or ())}
+    manifestPath = getManifestPath(outPath)
+    try:
+        with open(manifestPath + ".part", "w") as manifestFile:
+            json.dump(manifest, manifestFile, ensure_ascii=False)
+        os.replace(manifestPath + ".part", manifestPath)
+    except OSError:
+        pass
+
+
+def loadManifest(filePath, outPath, sources):
+    # a manifest only counts if the source is unchanged and nobody touched the output since
+    try:
+        with open(getManifestPath(outPath), "r") as manifestFile:
+            manifest = json.load(manifestFile)
+        if (manifest["version"] != MANIFEST_VERSION
+                or manifest["sources"] != [list(source) for source in sources]
+                or manifest["output"] != list(getStatKey(outPath) or ())
+                or manifest["sourceHash"] != scancache.getCache().getFileHash(filePath)):
+            return None
+        return manifest
+    except (OSError, ValueError, KeyError, sqlite3.Error):
+        return None
+
+
+def getDirtyRows(oldMapping, mapping, scans):
+    # {source: set of row indexes whose derived values change}, or None if every row has to be redone
+    if oldMapping.columnNames != mapping.columnNames:
+        return None
+    if oldMapping.defaults != mapping.defaults or oldMapping.multiples != mapping.multiples:
+        return None
+    dirtyRows = dict()
+    for source, scan in scans.items():
+        changedTags = [tag for tag in scan.vocabulary if oldMapping.lookup(tag) != mapping.lookup(tag)]
+        dirtyRows[source] = scan.getRowsWithTags(changedTags)
+    return dirtyRows
+
+
+def getPatchedCells(mapping, dirtyRows, scans, columns):
+    # {row number: {column index: value}} for the derived cells of the dirty rows; the derived block of
+    # the k-th tag column from the left starts right after it, shifted by the k blocks in front of it
+    width = len(mapping.columnNames)
+    cells = dict()
+    columns = sorted(columns, key=lambda item: getColumnIndex(item[0]))
+    for k, (column, source) in enumerate(columns):
+        start = getColumnIndex(column) + k * width + 1
+        scan = scans[source]
+        for rowIdx in dirtyRows[source]:
+            tags = scan.rowTags(rowIdx)
+            values = mapping.derive(tags)
+            rowCells = cells.setdefault(rowIdx + 2, dict())
+            for offset, value in enumerate(values):
+                rowCells[start + offset] = value
+    return cells
+
+
+def patchCsvRows(filePath, outPath, tmpPath, cells):
+    # the output was written in the source's format; sniffing the output itself can pick another delimiter
+    encoding, delimiter = csvFormat = detectCsvFormat(filePath)
+    with open(tmpPath, "w", encoding=encoding, newline="") as csvFile:
+        writer = csv.writer(csvFile, delimiter=delimiter)
+        for rowNum, row in enumerate(iterCsvRows(outPath, csvFormat), start=1):
+            rowCells = cells.get(rowNum)
+            if rowCells:
+                row.extend([None] * (max(rowCells) - len(row)))
+                for colIdx, value in rowCells.items():
+                    row[colIdx - 1] = value
+            writer.writerow(row)
+
+
+def patchTagColumns(filePath, sources, mapping, outPath, scans):
+    # rewrites only the derived cells of rows whose tags moved since the last save;
+    # returns False when the previous output can't be reused and a full save is needed
+    if not os.path.exists(outPath) or any(source not in scans for source in sources):
+        return False
+    manifest = loadManifest(filePath, outPath, sources)
+    if manifest is None:
+        return False
+    with profiling.phase("save.diff") as stats:
+        dirtyRows = getDirtyRows(CompiledMapping(manifest["used"]), mapping, scans)
+        stats["rows"] = sum(map(len, dirtyRows.values())) if dirtyRows is not None else None
+    if dirtyRows is None:
+        return False
+    if any(dirtyRows.values()):
+        from . import xlsxpatch
+        tmpPath = outPath + ".part"
+        try:
+            with profiling.phase("save.patchCells") as stats:
+                firstSheet = None if isCsvPath(filePath) else xlsxpatch.getSheetTitles(outPath)[0]
+                sheetColumns = dict()
+                for source in sources:
+                    sheetColumns.setdefault(source[0] or firstSheet, []).append((source[1], source))
+                sheetCells = {sheet: getPatchedCells(mapping, dirtyRows, scans, columns)
+                              for sheet, columns in sheetColumns.items()}
+                stats["rows"] = sum(map(len, sheetCells.values()))
+            with profiling.phase("save.patchWrite", rows=stats["rows"]):
+                if isCsvPath(filePath):
+                    patchCsvRows(filePath, outPath, tmpPath, sheetCells[None])
+                else:
+                    xlsxpatch.patchWorkbook(outPath, tmpPath, sheetCells)
+            os.replace(tmpPath, outPath)
+        except (xlsxpatch.PatchError, zipfile.BadZipFile, KeyError):
+            return False
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+    writeManifest(filePath, outPath, sources, mapping)
+    return True
+
+
+def saveTagColumns(filePath, sources, used, outPath=None, progress=None, seenTags=None, scans=None,
+                   incremental=True):
+    # sources: [(sheet name or None for the first sheet, column letter)]
+    outPath = outPath or getUpdatedPath(filePath)
+    with profiling.phase("save.compileMapping"):
+        mapping = used if isinstance(used, CompiledMapping) else CompiledMapping(used)
+    if isCsvPath(filePath):
+        checkCsvEncoding(mapping, detectCsvFormat(filePath)[0])
+    if incremental and scans and patchTagColumns(filePath, sources, mapping, outPath, scans):
+        if seenTags is not None:
+            for source in sources:
+                seenTags.update(scans[source].vocabulary)
+        if progress:
+            rowsTotal = sum(scans[source].rowCount for source in sources)
+            progress(rowsTotal, rowsTotal)
+        return outPath
+
+    deriver = RowDeriver(mapping, seenTags=seenTags, progress=progress)
+    sheetColumns = groupSourcesBySheet(sources, scans or {})
+    tmpPath = outPath + ".part"
+    try:
+        if isCsvPath(filePath):
+            saveCsvRows(filePath, tmpPath, deriver, sheetColumns)
+        else:
+            saveXlsxRows(filePath, tmpPath, deriver, sheetColumns)
+        os.replace(tmpPath, outPath)
+    finally:
+        if os.path.exists(tmpPath):
+            os.remove(tmpPath)
+    if incremental and scans:
+        writeManifest(filePath, outPath, sources, mapping)
+    if progress:
+        progress(deriver.rowsDone, deriver.rowsDone)
+    return outPath
@@ -0,0 +1,195 @@
+import argparse
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+from . import engine, profiling
+
+
+class MappingStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS columns (
+            name TEXT PRIMARY KEY,
+            position INTEGER NOT NULL,
+            defaultValue TEXT NOT NULL,
+            multipleValue TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS columnTags (
+            columnName TEXT NOT NULL REFERENCES columns(name) ON DELETE CASCADE,
+            tag TEXT NOT NULL,
+            PRIMARY KEY (columnName, tag)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS columnRules (
+            columnName TEXT NOT NULL REFERENCES columns(name) ON DELETE CASCADE,
+            position INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            pattern TEXT NOT NULL,
+            PRIMARY KEY (columnName, position)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS unusedTags (
+            tag TEXT PRIMARY KEY
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS pendingTags (
+            tag TEXT PRIMARY KEY,
+            source TEXT NOT NULL,
+            firstSeen REAL NOT NULL
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, dbPath="mapping.db"):
+        self.dbPath = dbPath
+        self.connection = sqlite3.connect(dbPath, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(self.SCHEMA)
+        self.depth = 0
+
+    def close(self):
+        self.connection.close()
+
+    @contextmanager
+    def transaction(self):
+        if self.depth == 0:
+            self.connection.execute("BEGIN IMMEDIATE")
+        self.depth += 1
+        try:
+            yield self.connection
+        except BaseException:
+            self.depth -= 1
+            if self.depth == 0:
+                self.connection.execute("ROLLBACK")
+            raise
+        self.depth -= 1
+        if self.depth == 0:
+            self.connection.execute("COMMIT")
+
+    def isEmpty(self):
+        return not self.connection.execute(
+            "SELECT EXISTS(SELECT 1 FROM columns) OR EXISTS(SELECT 1 FROM unusedTags)").fetchone()[0]
+
+    @profiling.traced("store.load")
+    def load(self):
+        conf = {"unused": set(), "used": {}}
+        for tag, in self.connection.execute("SELECT tag FROM unusedTags"):
+            conf["unused"].add(tag)
+        for name, defaultValue, multipleValue in self.connection.execute(
+                "SELECT name, defaultValue, multipleValue FROM columns ORDER BY position"):
+            conf["used"][name] = {"default": defaultValue, "multiple": multipleValue, "all": set(), "rules": []}
+        for columnName, tag in self.connection.execute("SELECT columnName, tag FROM columnTags"):
+            conf["used"][columnName]["all"].add(tag)
+        for columnName, ruleType, pattern in self.connection.execute(
+                "SELECT columnName, type, pattern FROM columnRules ORDER BY columnName, position"):
+            conf["used"][columnName]["rules"].append({"type": ruleType, "pattern": pattern})
+        return conf
+
+    @profiling.traced("store.import")
+    def importConfig(self, conf):
+        with self.transaction() as db:
+            db.execute("DELETE FROM columnTags")
+            db.execute("DELETE FROM columnRules")
+            db.execute("DELETE FROM columns")
+            db.execute("DELETE FROM unusedTags")
+            self.addUnused(conf["unused"])
+            for colName, colData in conf["used"].items():
+                self.putColumn(colName, colData)
+
+    def addUnused(self, tags):
+        with self.transaction() as db:
+            db.executemany("INSERT OR IGNORE INTO unusedTags (tag) VALUES (?)", ((tag,) for tag in tags))
+
+    def removeUnused(self, tags):
+        with self.transaction() as db:
+            db.executemany("DELETE FROM unusedTags WHERE tag = ?", ((tag,) for tag in tags))
+
+    def addPending(self, tags, source):
+        # tags found by the watcher that still wait for someone to classify them in the GUI
+        with self.transaction() as db:
+            db.executemany("INSERT OR IGNORE INTO pendingTags (tag, source, firstSeen) VALUES (?, ?, ?)",
+                           ((tag, source, time.time()) for tag in tags))
+
+    def loadPending(self):
+        with self.transaction() as db:
+            db.execute("DELETE FROM pendingTags WHERE tag IN (SELECT tag FROM unusedTags) "
+                       "OR tag IN (SELECT tag FROM columnTags)")
+            return {tag for tag, in db.execute("SELECT tag FROM pendingTags")}
+
+    def addColumnTags(self, colName, tags):
+        with self.transaction() as db:
+            db.executemany("INSERT OR IGNORE INTO columnTags (columnName, tag) VALUES (?, ?)",
+                           ((colName, tag) for tag in tags))
+
+    def removeColumnTags(self, colName, tags):
+        with self.transaction() as db:
+            db.executemany("DELETE FROM columnTags WHERE columnName = ? AND tag = ?",
+                           ((colName, tag) for tag in tags))
+
+    def putColumn(self, colName, colData, replaces=None):
+        with self.transaction() as db:
+            if replaces is not None and replaces != colName:
+                self.delColumn(replaces)
+            row = db.execute("SELECT position FROM columns WHERE name = ?", (colName,)).fetchone()
+            if row:
+                db.execute("UPDATE columns SET defaultValue = ?, multipleValue = ? WHERE name = ?",
+                           (colData["default"], colData["multiple"], colName))
+            else:
+                position = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM columns").fetchone()[0]
+                db.execute("INSERT INTO columns (name, position, defaultValue, multipleValue) VALUES (?, ?, ?, ?)",
+                           (colName, position, colData["default"], colData["multiple"]))
+            storedTags = {tag for tag, in db.execute("SELECT tag FROM columnTags WHERE columnName = ?",
+                                                     (colName,))}
+            self.removeColumnTags(colName, storedTags.difference(colData["all"]))
+            self.addColumnTags(colName, set(colData["all"]).difference(storedTags))
+            self.setColumnRules(colName, colData.get("rules", []))
+
+    def setColumnRules(self, colName, rules):
+        with self.transaction() as db:
+            db.execute("DELETE FROM columnRules WHERE columnName = ?", (colName,))
+            db.executemany("INSERT INTO columnRules (columnName, position, type, pattern) VALUES (?, ?, ?, ?)",
+                           ((colName, position, rule["type"], rule["pattern"]) for position, rule in enumerate(rules)))
+
+    def delColumn(self, colName):
+        with self.transaction() as db:
+            db.execute("DELETE FROM columns WHERE name = ?", (colName,))
+
+
+def openStore(dbPath="mapping.db", configPath="config.json"):
+    store = MappingStore(dbPath)
+    if store.isEmpty():
+        conf = engine.loadConfig(configPath)
+        if conf["used"] or conf["unused"]:
+            store.importConfig(conf)
+    return store
+
+
+def loadMapping(path):
+    if path.endswith(".json"):
+        return engine.loadConfig(path)
+    store = MappingStore(path)
+    try:
+        return store.load()
+    finally:
+        store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Импорт и экспорт настроек колонок")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("config", help="путь к config.json")
+    parser.add_argument("--db", default="mapping.db", help="путь к базе настроек")
+    args = parser.parse_args(argv)
+
+    store = MappingStore(args.db)
+    try:
+        if args.command == "import":
+            store.importConfig(engine.loadConfig(args.config))
+        else:
+            engine.saveConfig(store.load(), args.config)
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,156 @@
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Unix only; on Windows the memory peak is simply not reported
+    resource = None
+
+PROFILE_ENV = "TAGSPARSER_PROFILE"
+TRACE_ENV = "TAGSPARSER_TRACE"
+TRACEMALLOC_ENV = "TAGSPARSER_TRACEMALLOC"
+MAX_RECORDS = 100000
+
+
+def getPeakRssKb():
+    # ru_maxrss is the high-water mark of the whole process so far, not of one phase: a record's
+    # peakRssKb only says how much memory the process had needed by the time the phase ended
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+class Tracer:
+
+    def __init__(self):
+        self.records = deque(maxlen=MAX_RECORDS)
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.originEpoch = time.time()
+
+    def addRecord(self, name, started, wallSeconds, cpuSeconds, rows=None, **args):
+        record = {"name": name,
+                  "start": started - self.origin,
+                  "wallSeconds": wallSeconds,
+                  "cpuSeconds": cpuSeconds,
+                  "rows": rows,
+                  "peakRssKb": getPeakRssKb(),
+                  "pid": os.getpid(),
+                  "thread": threading.current_thread().name}
+        if tracemalloc.is_tracing():
+            record["peakTracedKb"] = tracemalloc.get_traced_memory()[1] // 1024
+        record.update(args)
+        with self.lock:
+            self.records.append(record)
+        return record
+
+    @contextmanager
+    def phase(self, name, rows=None, **args):
+        stats = {"rows": rows}
+        started = time.perf_counter()
+        cpuStarted = time.thread_time()
+        try:
+            yield stats
+        finally:
+            self.addRecord(name, started, time.perf_counter() - started, time.thread_time() - cpuStarted,
+                           **stats, **args)
+
+    def merge(self, records):
+        with self.lock:
+            self.records.extend(records)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def summary(self):
+        phases = dict()
+        with self.lock:
+            records = list(self.records)
+        for record in records:
+            total = phases.setdefault(record["name"], {"count": 0, "wallSeconds": 0, "cpuSeconds": 0,
+                                                       "rows": 0, "peakRssKb": None})
+            total["count"] += 1
+            total["wallSeconds"] += record["wallSeconds"]
+            total["cpuSeconds"] += record["cpuSeconds"]
+            total["rows"] += record["rows"] or 0
+            if record["peakRssKb"] is not None:
+                total["peakRssKb"] = max(total["peakRssKb"] or 0, record["peakRssKb"])
+        return phases
+
+    def getTraceEvents(self):
+        with self.lock:
+            records = list(self.records)
+        threadIds = dict()
+        events = []
+        for record in records:
+            tid = threadIds.setdefault((record["pid"], record["thread"]), len(threadIds))
+            events.append({"name": record["name"],
+                           "ph": "X",
+                           "ts": int(record["start"] * 1e6),
+                           "dur": int(record["wallSeconds"] * 1e6),
+                           "pid": record["pid"],
+                           "tid": tid,
+                           "args": {key: value for key, value in record.items()
+                                    if key not in ("name", "start", "pid", "thread")}})
+        return events
+
+    def writeTrace(self, path):
+        # the file is both a plain phase dump and a Chrome/Perfetto trace: viewers read "traceEvents" only
+        with self.lock:
+            records = list(self.records)
+        trace = {"startedAt": self.originEpoch,
+                 "phases": records,
+                 "summary": self.summary(),
+                 "traceEvents": self.getTraceEvents()}
+        with open(path, "w") as traceFile:
+            json.dump(trace, traceFile, ensure_ascii=False, indent=1)
+
+
+tracer = Tracer()
+phase = tracer.phase
+
+
+def traced(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+if os.environ.get(TRACEMALLOC_ENV):
+    tracemalloc.start()
+
+
+@contextmanager
+def profiled(name, prefix=None):
+    prefix = prefix or os.environ.get(PROFILE_ENV)
+    if not prefix:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats("%s.%s.%d.prof" % (prefix, name, os.getpid()))
+
+
+def writeTraceFromEnv():
+    path = os.environ.get(TRACE_ENV)
+    if path:
+        tracer.writeTrace(path)
@@ -0,0 +1,146 @@
+import re
+from collections import deque
+
+NORMALIZED = "norm"
+PREFIX = "prefix"
+SUBSTRING = "substring"
+REGEX = "regex"
+RULE_TYPES = (NORMALIZED, PREFIX, SUBSTRING, REGEX)
+MAX_CACHED_TOKENS = 1000000
+
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+class RuleError(ValueError):
+    pass
+
+
+def normalize(tag):
+    return WHITESPACE_RE.sub(" ", tag.casefold().replace("ё", "е")).strip()
+
+
+def compileRegex(pattern):
+    # parseRules and RuleMatcher share this, so a rule accepted in the editor always compiles for matching
+    try:
+        return re.compile(pattern)
+    except re.error as e:
+        raise RuleError("Ошибка в регулярном выражении \"%s\": %s" % (pattern, e))
+
+
+def parseRules(text):
+    rules = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        ruleType, sep, pattern = line.partition(":")
+        ruleType = ruleType.strip().lower()
+        if not sep or ruleType not in RULE_TYPES or not pattern.strip():
+            raise RuleError("Непонятное правило \"%s\", нужно %s:значение" % (line, "/".join(RULE_TYPES)))
+        pattern = pattern.strip()
+        if ruleType == REGEX:
+            compileRegex(pattern)
+        rules.append({"type": ruleType, "pattern": pattern})
+    return rules
+
+
+def formatRules(rules):
+    return "\n".join("%s:%s" % (rule["type"], rule["pattern"]) for rule in rules)
+
+
+class AhoCorasick:
+
+    def __init__(self):
+        self.goto = [dict()]
+        self.fail = [0]
+        self.output = [set()]
+
+    def add(self, pattern, value):
+        node = 0
+        for char in pattern:
+            nextNode = self.goto[node].get(char)
+            if nextNode is None:
+                nextNode = self.goto[node][char] = len(self.goto)
+                self.goto.append(dict())
+                self.fail.append(0)
+                self.output.append(set())
+            node = nextNode
+        self.output[node].add(value)
+
+    def build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.output[child] |= self.output[self.fail[child]]
+
+    def search(self, text):
+        found = set()
+        node = 0
+        for char in text:
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            found |= self.output[node]
+        return found
+
+    def prefixes(self, text):
+        found = set()
+        node = 0
+        for char in text:
+            node = self.goto[node].get(char)
+            if node is None:
+                break
+            found |= self.output[node]
+        return found
+
+
+class RuleMatcher:
+
+    def __init__(self, columnRules):
+        # columnRules: [(column index, [{"type": ..., "pattern": ...}])]
+        self.normalized = dict()
+        self.prefixTrie = AhoCorasick()
+        self.substrings = AhoCorasick()
+        self.regexes = []
+        self.cache = dict()
+        for colIdx, colRules in columnRules:
+            for rule in colRules:
+                if rule["type"] == NORMALIZED:
+                    self.normalized.setdefault(normalize(rule["pattern"]), set()).add(colIdx)
+                elif rule["type"] == PREFIX:
+                    self.prefixTrie.add(normalize(rule["pattern"]), colIdx)
+                elif rule["type"] == SUBSTRING:
+                    self.substrings.add(normalize(rule["pattern"]), colIdx)
+                elif rule["type"] == REGEX:
+                    self.regexes.append((compileRegex(rule["pattern"]), colIdx))
+        self.substrings.build()
+        self.empty = not (self.normalized or self.prefixTrie.goto[0] or self.substrings.goto[0] or self.regexes)
+
+    @classmethod
+    def fromUsed(cls, used):
+        return cls([(colIdx, colData.get("rules", [])) for colIdx, colData in enumerate(used.values())])
+
+    def match(self, tag):
+        columns = self.cache.get(tag)
+        if columns is not None:
+            return columns
+        if self.empty:
+            return ()
+
+        normTag = normalize(tag)
+        found = set(self.normalized.get(normTag, ()))
+        found |= self.prefixTrie.prefixes(normTag)
+        found |= self.substrings.search(normTag)
+        found.update(colIdx for regex, colIdx in self.regexes if colIdx not in found and regex.search(tag))
+
+        columns = tuple(sorted(found))
+        if len(self.cache) >= MAX_CACHED_TOKENS:
+            self.cache.clear()
+        self.cache[tag] = columns
+        return columns
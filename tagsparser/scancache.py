@@ -0,0 +1,124 @@
+import hashlib
+import os
+import sqlite3
+import sys
+import time
+
+CACHE_DIR_ENV = "TAGSPARSER_CACHE_DIR"
+CACHE_SIZE_ENV = "TAGSPARSER_CACHE_SIZE_MB"
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+HASH_CHUNK = 1024 * 1024
+ENTRY_SUFFIX = ".scan"
+
+
+def getDefaultCacheDir():
+    if os.environ.get(CACHE_DIR_ENV):
+        return os.environ[CACHE_DIR_ENV]
+    if sys.platform == "win32":
+        base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "tagsparser")
+
+
+class ScanCache:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            lastUsed REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS fileHashes (
+            path TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime INTEGER NOT NULL,
+            hash TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, cacheDir=None, maxBytes=None):
+        self.cacheDir = cacheDir or getDefaultCacheDir()
+        if maxBytes is None:
+            sizeMb = os.environ.get(CACHE_SIZE_ENV)
+            maxBytes = int(sizeMb) * 1024 * 1024 if sizeMb else DEFAULT_MAX_BYTES
+        self.maxBytes = maxBytes
+        os.makedirs(self.cacheDir, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(self.cacheDir, "index.db"), timeout=30,
+                                          isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(self.SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def getFileHash(self, filePath):
+        path = os.path.abspath(filePath)
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT hash FROM fileHashes WHERE path = ? AND size = ? AND mtime = ?",
+                                      (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row:
+            return row[0]
+        digest = hashlib.sha1()
+        with open(path, "rb") as dataFile:
+            for chunk in iter(lambda: dataFile.read(HASH_CHUNK), b""):
+                digest.update(chunk)
+        fileHash = digest.hexdigest()
+        self.connection.execute("INSERT OR REPLACE INTO fileHashes (path, size, mtime, hash) VALUES (?, ?, ?, ?)",
+                                (path, stat.st_size, stat.st_mtime_ns, fileHash))
+        return fileHash
+
+    def getKey(self, filePath, sheet, column, version):
+        keySource = "\0".join((self.getFileHash(filePath), sheet or "", column, str(version)))
+        return hashlib.sha1(keySource.encode("utf-8")).hexdigest()
+
+    def getEntryPath(self, key):
+        return os.path.join(self.cacheDir, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        entryPath = self.getEntryPath(key)
+        if not os.path.exists(entryPath):
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            return None
+        self.connection.execute("UPDATE entries SET lastUsed = ? WHERE key = ?", (time.time(), key))
+        return entryPath
+
+    def put(self, key, writeEntry):
+        entryPath = self.getEntryPath(key)
+        tmpPath = "%s.%d.tmp" % (entryPath, os.getpid())
+        try:
+            with open(tmpPath, "wb") as entryFile:
+                writeEntry(entryFile)
+            os.replace(tmpPath, entryPath)
+        finally:
+            if os.path.exists(tmpPath):
+                os.remove(tmpPath)
+        self.connection.execute("INSERT OR REPLACE INTO entries (key, size, lastUsed) VALUES (?, ?, ?)",
+                                (key, os.path.getsize(entryPath), time.time()))
+        self.evict()
+
+    def evict(self):
+        totalSize = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if totalSize <= self.maxBytes:
+            return
+        for key, size in self.connection.execute("SELECT key, size FROM entries ORDER BY lastUsed").fetchall():
+            try:
+                os.remove(self.getEntryPath(key))
+            except FileNotFoundError:
+                pass
+            self.connection.execute("DELETE FROM entries WHERE key = ?", (key,))
+            totalSize -= size
+            if totalSize <= self.maxBytes:
+                break
+
+
+defaultCache = None
+defaultCachePid = None
+
+
+def getCache():
+    # an SQLite connection must not cross fork(), so forked workers open their own
+    global defaultCache, defaultCachePid
+    if defaultCache is None or defaultCachePid != os.getpid():
+        defaultCache = ScanCache()
+        defaultCachePid = os.getpid()
+    return defaultCache
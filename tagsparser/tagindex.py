@@ -0,0 +1,217 @@
+from bisect import bisect_left, insort
+from itertools import compress
+from operator import itemgetter, not_
+
+NGRAM = 3
+MAX_CHAR = "\U0010ffff"
+MAX_INPLACE_CHANGES = 500
+
+
+def getNgrams(folded):
+    return {folded[i:i + NGRAM] for i in range(len(folded) - NGRAM + 1)}
+
+
+class TagIndex:
+
+    def __init__(self, tags=()):
+        self.folded = dict()
+        self.keys = []
+        self.ngrams = dict()
+        self.setTags(tags)
+
+    def setTags(self, tags):
+        self.folded = {tag: tag.casefold() for tag in tags}
+        self.keys = sorted((folded, tag) for tag, folded in self.folded.items())
+        self.ngrams = dict()
+        for tag, folded in self.folded.items():
+            for gram in getNgrams(folded):
+                self.ngrams.setdefault(gram, set()).add(tag)
+
+    def add(self, tag):
+        if tag in self.folded:
+            return
+        folded = self.folded[tag] = tag.casefold()
+        insort(self.keys, (folded, tag))
+        for gram in getNgrams(folded):
+            self.ngrams.setdefault(gram, set()).add(tag)
+
+    def remove(self, tag):
+        folded = self.folded.pop(tag, None)
+        if folded is None:
+            return
+        del self.keys[bisect_left(self.keys, (folded, tag))]
+        for gram in getNgrams(folded):
+            tags = self.ngrams[gram]
+            tags.discard(tag)
+            if not tags:
+                del self.ngrams[gram]
+
+    def matches(self, query, tag):
+        query = query.casefold()
+        folded = self.folded.get(tag) or tag.casefold()
+        return folded.startswith(query) if len(query) < NGRAM else query in folded
+
+    def search(self, query):
+        # queries shorter than an n-gram match by prefix, longer ones by substring; returns a set
+        query = query.casefold()
+        if len(query) < NGRAM:
+            start = bisect_left(self.keys, (query,))
+            end = bisect_left(self.keys, (query + MAX_CHAR,))
+            return {tag for folded, tag in self.keys[start:end]}
+        postings = sorted((self.ngrams.get(gram, ()) for gram in getNgrams(query)), key=len)
+        if not postings[0]:
+            return set()
+        if len(query) == NGRAM:
+            return set(postings[0])
+        candidates = postings[0].intersection(*postings[1:])
+        return {tag for tag in candidates if query in self.folded[tag]}
+
+
+class FilteredTags:
+    # every item in display order, sorted by (group, folded text, text), plus the part the current
+    # query lets through; the order is kept on every change, so filtering never sorts again
+
+    def __init__(self):
+        self.keys = []
+        self.texts = []
+        self.items = []
+        self.groups = dict()
+        self.index = TagIndex()
+        self.query = ""
+        self.visibleKeys = []
+        self.visibleItems = []
+
+    def makeKey(self, text, group):
+        return group, self.index.folded.get(text) or text.casefold(), text
+
+    def setItems(self, items, index=None):
+        # items: [(group, {"text": tag, ...})]; index may be prebuilt off the UI thread over a superset
+        items = list(items)
+        if index is None:
+            index = TagIndex(item["text"] for group, item in items)
+        else:
+            for group, item in items:
+                index.add(item["text"])
+        self.index = index
+        self.setPairs(sorted(((self.makeKey(item["text"], group), item) for group, item in items), key=itemgetter(0)))
+        self.refilter()
+
+    def setPairs(self, pairs):
+        self.keys = [key for key, item in pairs]
+        self.texts = [key[2] for key in self.keys]
+        self.items = [item for key, item in pairs]
+        self.groups = {key[2]: key[0] for key in self.keys}
+
+    def setFilter(self, query):
+        query = query.strip()
+        prevFolded = self.query.casefold()
+        self.query = query
+        folded = query.casefold()
+        if len(folded) >= NGRAM and len(prevFolded) >= NGRAM and prevFolded in folded:
+            # typing on narrows a substring match, so only the visible part is walked
+            selectors = [folded in key[1] for key in self.visibleKeys]
+            self.visibleKeys = list(compress(self.visibleKeys, selectors))
+            self.visibleItems = list(compress(self.visibleItems, selectors))
+        else:
+            self.refilter()
+
+    def refilter(self):
+        folded = self.query.casefold()
+        if not folded:
+            self.visibleKeys = list(self.keys)
+            self.visibleItems = list(self.items)
+        elif len(folded) < NGRAM:
+            # a prefix match is one contiguous slice of every group
+            self.visibleKeys = []
+            self.visibleItems = []
+            start = 0
+            while start < len(self.keys):
+                group = self.keys[start][0]
+                lo = bisect_left(self.keys, (group, folded), start)
+                hi = bisect_left(self.keys, (group, folded + MAX_CHAR), lo)
+                self.visibleKeys.extend(self.keys[lo:hi])
+                self.visibleItems.extend(self.items[lo:hi])
+                start = bisect_left(self.keys, (group, MAX_CHAR), hi)
+        else:
+            matches = self.index.search(folded)
+            selectors = list(map(matches.__contains__, self.texts))
+            self.visibleKeys = list(compress(self.keys, selectors))
+            self.visibleItems = list(compress(self.items, selectors))
+
+    def isVisible(self, text):
+        return not self.query or self.index.matches(self.query, text)
+
+    def findKey(self, keys, text):
+        if text not in self.groups:
+            return None
+        key = self.makeKey(text, self.groups[text])
+        idx = bisect_left(keys, key)
+        if idx == len(keys) or keys[idx] != key:
+            return None
+        return idx
+
+    def indexOf(self, text):
+        return self.findKey(self.visibleKeys, text)
+
+    def getItem(self, text):
+        idx = self.findKey(self.keys, text)
+        return None if idx is None else self.items[idx]
+
+    def add(self, group, item):
+        # returns the visible position the item went to, or None if the query hides it
+        text = item["text"]
+        self.remove(text)
+        self.index.add(text)
+        key = self.makeKey(text, group)
+        self.groups[text] = group
+        idx = bisect_left(self.keys, key)
+        self.keys.insert(idx, key)
+        self.texts.insert(idx, text)
+        self.items.insert(idx, item)
+        if not self.isVisible(text):
+            return None
+        idx = bisect_left(self.visibleKeys, key)
+        self.visibleKeys.insert(idx, key)
+        self.visibleItems.insert(idx, item)
+        return idx
+
+    def remove(self, text):
+        # returns the visible position the item left, or None if it was hidden
+        idx = self.findKey(self.keys, text)
+        if idx is None:
+            return None
+        visibleIdx = self.indexOf(text)
+        del self.keys[idx]
+        del self.texts[idx]
+        del self.items[idx]
+        del self.groups[text]
+        if visibleIdx is not None:
+            del self.visibleKeys[visibleIdx]
+            del self.visibleItems[visibleIdx]
+        return visibleIdx
+
+    def applyChanges(self, removed, added):
+        # added: [(group, item)]; a few changes go in place, a bulk change rebuilds the order once
+        removed = list(removed)
+        added = list(added)
+        if len(removed) + len(added) <= MAX_INPLACE_CHANGES:
+            for text in removed:
+                self.remove(text)
+            for group, item in added:
+                self.add(group, item)
+            return
+        dropped = set(removed).union(item["text"] for group, item in added)
+        kept = list(map(not_, map(dropped.__contains__, self.texts)))
+        for group, item in added:
+            self.index.add(item["text"])
+        pairs = list(zip(compress(self.keys, kept), compress(self.items, kept)))
+        pairs.extend((self.makeKey(item["text"], group), item) for group, item in added)
+        pairs.sort(key=itemgetter(0))
+        self.setPairs(pairs)
+        self.refilter()
+
+    def getVisibleTexts(self):
+        return [key[2] for key in self.visibleKeys]
+
+    def __contains__(self, text):
+        return text in self.groups
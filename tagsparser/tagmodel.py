@@ -0,0 +1,206 @@
+from contextlib import contextmanager
+
+from . import rules
+
+
+NEW = "new"
+UNUSED = "unused"
+ASSIGNED = "assigned"
+
+
+class TagStateModel:
+
+    def __init__(self, conf):
+        self.conf = conf
+        self.states = dict()
+        self.tagColumns = dict()
+        self.newTags = set()
+        self.unusedTags = set()
+        self.assignedTags = set()
+        self.sheetNewTags = set()
+        self.pendingTags = set()
+        self.ruleMatchedTags = set()
+        self.matcher = rules.RuleMatcher.fromUsed(conf["used"])
+        self.selectedTags = set()
+        self.anchorTag = None
+        self.listeners = []
+        self.batchListeners = []
+        self.changes = None
+
+        for colName, colData in conf["used"].items():
+            for tag in colData["all"]:
+                self.tagColumns.setdefault(tag, set()).add(colName)
+                self.setState(tag, ASSIGNED, notify=False)
+
+    def loadSheet(self, sheetTags, pendingTags=()):
+        # pending tags were found by the folder watcher in other files; they are listed as new,
+        # but stay pending until the user assigns them or marks them unused
+        knownTags = self.conf["unused"].union(self.tagColumns)
+        self.pendingTags = set(pendingTags).difference(sheetTags, knownTags)
+        self.sheetNewTags = set(sheetTags).difference(knownTags).union(self.pendingTags)
+        self.selectedTags = set()
+        self.anchorTag = None
+        for tag in list(self.newTags) + list(self.unusedTags):
+            del self.states[tag]
+        for tag in self.ruleMatchedTags.difference(self.tagColumns):
+            self.setState(tag, None, notify=False)
+        self.newTags = set()
+        self.unusedTags = set()
+        self.ruleMatchedTags = set()
+        for tag in self.sheetNewTags:
+            self.setState(tag, NEW, notify=False)
+        for tag in self.conf["unused"].intersection(sheetTags):
+            self.setState(tag, UNUSED, notify=False)
+        self.applyRules(notify=False)
+
+    def matchesRule(self, tag):
+        return bool(self.matcher.match(tag))
+
+    def applyRules(self, notify=True):
+        # tags caught by a column rule leave the lists, and come back once no rule matches them
+        self.matcher = rules.RuleMatcher.fromUsed(self.conf["used"])
+        for tag in list(self.ruleMatchedTags):
+            if tag in self.tagColumns or self.matchesRule(tag):
+                continue
+            self.ruleMatchedTags.discard(tag)
+            self.setState(tag, NEW if self.isNew(tag) else UNUSED, notify)
+        for tag in list(self.newTags) + list(self.unusedTags):
+            if self.matchesRule(tag):
+                self.ruleMatchedTags.add(tag)
+                self.setState(tag, ASSIGNED, notify)
+
+    def getState(self, tag):
+        return self.states.get(tag)
+
+    def isNew(self, tag):
+        return tag in self.sheetNewTags
+
+    def setState(self, tag, state, notify=True):
+        oldState = self.states.get(tag)
+        for stateSet in (self.newTags, self.unusedTags, self.assignedTags):
+            stateSet.discard(tag)
+        if state is None:
+            self.states.pop(tag, None)
+        else:
+            self.states[tag] = state
+            {NEW: self.newTags, UNUSED: self.unusedTags, ASSIGNED: self.assignedTags}[state].add(tag)
+        if notify and oldState != state:
+            if self.changes is not None:
+                self.changes.append((tag, oldState, state))
+                return
+            for listener in self.listeners:
+                listener(tag, oldState, state)
+
+    @contextmanager
+    def batch(self):
+        # state changes made inside are delivered together once the outermost batch ends
+        if self.changes is not None:
+            yield
+            return
+        self.changes = []
+        try:
+            yield
+        finally:
+            changes, self.changes = self.changes, None
+            if changes and self.batchListeners:
+                for listener in self.batchListeners:
+                    listener(changes)
+            else:
+                for change in changes:
+                    for listener in self.listeners:
+                        listener(*change)
+
+    def select(self, tags, add=False):
+        # returns the tags whose selection changed
+        tags = set(tags)
+        if add:
+            changed = tags.difference(self.selectedTags)
+            self.selectedTags.update(tags)
+        else:
+            changed = tags.symmetric_difference(self.selectedTags)
+            self.selectedTags = tags
+        return changed
+
+    def toggleSelected(self, tag):
+        self.selectedTags.symmetric_difference_update({tag})
+        return {tag}
+
+    def clearSelection(self):
+        return self.select(())
+
+    def assign(self, tags, colName):
+        removedFromUnused = []
+        colTags = self.conf["used"][colName]["all"]
+        for tag in tags:
+            self.selectedTags.discard(tag)
+            colTags.add(tag)
+            self.tagColumns.setdefault(tag, set()).add(colName)
+            if tag in self.conf["unused"]:
+                self.conf["unused"].remove(tag)
+                removedFromUnused.append(tag)
+            self.setState(tag, ASSIGNED)
+        return removedFromUnused
+
+    def release(self, tags, colName):
+        addedToUnused = []
+        for tag in tags:
+            columns = self.tagColumns.get(tag, set())
+            columns.discard(colName)
+            if columns:
+                continue
+            self.tagColumns.pop(tag, None)
+            if self.isNew(tag):
+                state = NEW
+            else:
+                if tag not in self.conf["unused"]:
+                    self.conf["unused"].add(tag)
+                    addedToUnused.append(tag)
+                state = UNUSED
+            if self.matchesRule(tag):
+                self.ruleMatchedTags.add(tag)
+                state = ASSIGNED
+            self.setState(tag, state)
+        return addedToUnused
+
+    def markUnused(self, tags):
+        addedToUnused = []
+        for tag in tags:
+            if self.getState(tag) != NEW:
+                continue
+            self.selectedTags.discard(tag)
+            self.conf["unused"].add(tag)
+            addedToUnused.append(tag)
+            self.setState(tag, UNUSED)
+        return addedToUnused
+
+    def deleteColumn(self, colName):
+        colData = self.conf["used"].pop(colName)
+        self.applyRules()
+        return self.release(colData["all"], colName)
+
+    def updateColumn(self, columnName, creationName, defaultValue, multipleValue, tagsSet, columnRules=None):
+        addedToUnused = []
+        if creationName and columnName != creationName:
+            oldData = self.conf["used"].pop(creationName)
+            addedToUnused.extend(self.release(oldData["all"].difference(tagsSet), creationName))
+            for tag in oldData["all"].intersection(tagsSet):
+                self.tagColumns[tag].discard(creationName)
+            prevTags = set()
+        else:
+            prevTags = self.conf["used"].get(columnName, {}).get("all", set())
+            addedToUnused.extend(self.release(prevTags.difference(tagsSet), columnName))
+
+        colData = self.conf["used"].setdefault(columnName, dict())
+        colData["default"] = defaultValue
+        colData["multiple"] = multipleValue
+        colData["rules"] = list(columnRules or [])
+        colData["all"] = set()
+        colData["all"].update(prevTags.intersection(tagsSet))
+        self.assign(tagsSet.difference(colData["all"]), columnName)
+        self.applyRules()
+        return colData, addedToUnused
+
+    def commitNewTags(self):
+        newTags = self.newTags.difference(self.pendingTags)
+        self.conf["unused"].update(newTags)
+        return newTags
@@ -0,0 +1,316 @@
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import statistics
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from . import batch, engine, mappingstore, scancache
+
+STATE_NAME = ".tagsparser-watch.db"
+STATUS_NAME = ".tagsparser-watch.json"
+RESCAN_SECONDS = 60
+STATUS_SECONDS = 1
+RECENT_FILES = 100
+
+
+def isWatchedPath(filePath):
+    name = os.path.basename(filePath)
+    root = os.path.splitext(filePath)[0]
+    return engine.isSupportedPath(filePath) and not root.endswith("_updated") and not name.startswith((".", "~$"))
+
+
+def startObserver(watchDir, events):
+    # watchdog is optional: it uses inotify on Linux, without it the folder is polled
+    try:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+    except ImportError:
+        return None
+
+    class Handler(FileSystemEventHandler):
+
+        def on_created(self, event):
+            if not event.is_directory:
+                events.put(event.src_path)
+
+        def on_modified(self, event):
+            if not event.is_directory:
+                events.put(event.src_path)
+
+        def on_moved(self, event):
+            if not event.is_directory:
+                events.put(event.dest_path)
+
+    observer = Observer()
+    observer.schedule(Handler(), watchDir, recursive=False)
+    observer.start()
+    return observer
+
+
+class DoneFiles:
+
+    def __init__(self, statePath):
+        self.connection = sqlite3.connect(statePath, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS doneFiles (
+                hash TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                outPath TEXT NOT NULL,
+                finishedAt REAL NOT NULL
+            ) WITHOUT ROWID""")
+
+    def close(self):
+        self.connection.close()
+
+    def __contains__(self, fileHash):
+        return self.connection.execute("SELECT 1 FROM doneFiles WHERE hash = ?", (fileHash,)).fetchone() is not None
+
+    def add(self, fileHash, filePath, outPath):
+        self.connection.execute("INSERT OR REPLACE INTO doneFiles (hash, path, outPath, finishedAt) "
+                                "VALUES (?, ?, ?, ?)", (fileHash, filePath, outPath, time.time()))
+
+
+class FolderWatcher:
+
+    def __init__(self, watchDir, configPath, sources, workers=None, statusPath=None, statePath=None,
+                 pollSeconds=2.0, settleSeconds=2.0, dbPath=None):
+        self.watchDir = watchDir
+        self.configPath = configPath
+        # a config.json has nowhere to keep new tags, so they go to the GUI's mapping.db
+        self.dbPath = dbPath or ("mapping.db" if configPath.endswith(".json") else configPath)
+        self.sources = sources
+        self.workers = workers or os.cpu_count()
+        self.statusPath = statusPath or os.path.join(watchDir, STATUS_NAME)
+        self.doneFiles = DoneFiles(statePath or os.path.join(watchDir, STATE_NAME))
+        self.pollSeconds = pollSeconds
+        self.settleSeconds = settleSeconds
+
+        self.events = queue.SimpleQueue()
+        self.backend = "polling"
+        self.seen = dict()
+        self.settling = dict()  # path: (stat key, last change, first seen)
+        self.queue = deque()
+        self.queuedHashes = set()
+        self.inFlight = dict()
+        self.conf = None
+        self.confVersion = None
+        self.store = None
+
+        self.startedAt = time.time()
+        self.processed = 0
+        self.failed = 0
+        self.skipped = 0
+        self.newTagsTotal = 0
+        self.bytesProcessed = 0
+        self.recent = deque(maxlen=RECENT_FILES)
+        self.errors = deque(maxlen=RECENT_FILES)
+        self.statusWrittenAt = 0
+
+    def getConfVersion(self):
+        return tuple(engine.getStatKey(path) for path in (self.configPath, self.configPath + "-wal"))
+
+    def getConf(self):
+        # the GUI may edit the mapping while the watcher runs, so it is re-read once it changes
+        version = self.getConfVersion()
+        if self.conf is None or version != self.confVersion:
+            self.conf = mappingstore.loadMapping(self.configPath)
+            self.confVersion = version
+        return self.conf
+
+    def noteChange(self, filePath, now):
+        if not isWatchedPath(filePath):
+            return
+        key = engine.getStatKey(filePath)
+        if key is None or self.seen.get(filePath) == key:
+            return
+        prev = self.settling.get(filePath)
+        if prev is None or prev[0] != key:
+            self.settling[filePath] = (key, now, prev[2] if prev else now)
+
+    def fileError(self, filePath, error, now):
+        self.errors.append({"path": filePath, "error": str(error), "at": now})
+        print("%s: ошибка: %s" % (filePath, error), file=sys.stderr)
+
+    def scanDir(self, now):
+        # a file may vanish or be locked at any moment; that is recorded and the folder is polled on
+        try:
+            entries = list(os.scandir(self.watchDir))
+        except OSError as e:
+            self.fileError(self.watchDir, e, now)
+            return
+        for entry in entries:
+            try:
+                if entry.is_file():
+                    self.noteChange(entry.path, now)
+            except OSError as e:
+                self.fileError(entry.path, e, now)
+
+    def promoteSettled(self, now):
+        # a file is queued only once its size and mtime stop changing, so half-copied files are not read
+        for filePath, (key, changedAt, firstSeen) in list(self.settling.items()):
+            if now - changedAt < self.settleSeconds:
+                continue
+            del self.settling[filePath]
+            try:
+                currentKey = engine.getStatKey(filePath)
+                if currentKey is None:
+                    continue
+                if currentKey != key:
+                    self.settling[filePath] = (currentKey, now, firstSeen)
+                    continue
+                fileHash = scancache.getCache().getFileHash(filePath)
+            except (OSError, sqlite3.Error) as e:
+                self.fileError(filePath, e, now)
+                continue
+            self.seen[filePath] = key
+            if fileHash in self.doneFiles or fileHash in self.queuedHashes:
+                self.skipped += 1
+                continue
+            self.queuedHashes.add(fileHash)
+            self.queue.append((filePath, fileHash, firstSeen))
+
+    def submitQueued(self, pool):
+        while self.queue and len(self.inFlight) < self.workers:
+            filePath, fileHash, firstSeen = self.queue.popleft()
+            future = pool.submit(batch.processFile, filePath, self.sources, self.getConf())
+            self.inFlight[future] = (filePath, fileHash, firstSeen, time.time())
+
+    def fileFinished(self, future):
+        filePath, fileHash, firstSeen, submittedAt = self.inFlight.pop(future)
+        self.queuedHashes.discard(fileHash)
+        finishedAt = time.time()
+        try:
+            outPath, newTags, elapsed, records = future.result()
+        except Exception as e:
+            self.failed += 1
+            self.fileError(filePath, e, finishedAt)
+            return
+        self.doneFiles.add(fileHash, filePath, outPath)
+        self.processed += 1
+        try:
+            self.bytesProcessed += os.path.getsize(filePath)
+        except OSError:
+            pass
+        self.newTagsTotal += len(newTags)
+        if newTags:
+            self.store.addPending(newTags, filePath)
+        self.recent.append({"path": filePath,
+                            "outPath": outPath,
+                            "latencySeconds": finishedAt - firstSeen,
+                            "waitSeconds": submittedAt - firstSeen,
+                            "processSeconds": elapsed,
+                            "newTags": len(newTags),
+                            "finishedAt": finishedAt})
+        print("%s -> %s (%.1f с, новых тегов: %d)" % (filePath, outPath, elapsed, len(newTags)))
+
+    def getStatus(self, now):
+        latencies = [record["latencySeconds"] for record in self.recent]
+        uptime = now - self.startedAt
+        return {"pid": os.getpid(),
+                "watchDir": os.path.abspath(self.watchDir),
+                "backend": self.backend,
+                "workers": self.workers,
+                "startedAt": self.startedAt,
+                "updatedAt": now,
+                "queueDepth": len(self.queue),
+                "settling": len(self.settling),
+                "inFlight": len(self.inFlight),
+                "processed": self.processed,
+                "failed": self.failed,
+                "skipped": self.skipped,
+                "newTags": self.newTagsTotal,
+                "filesPerMinute": self.processed * 60 / uptime if uptime else 0,
+                "filesLastMinute": sum(1 for record in self.recent if now - record["finishedAt"] <= 60),
+                "bytesPerSecond": self.bytesProcessed / uptime if uptime else 0,
+                "latency": {"lastSeconds": latencies[-1] if latencies else None,
+                            "meanSeconds": statistics.mean(latencies) if latencies else None,
+                            "p95Seconds": sorted(latencies)[int(len(latencies) * 0.95)] if latencies else None},
+                "recent": list(self.recent)[-20:],
+                "errors": list(self.errors)[-20:]}
+
+    def writeStatus(self, now):
+        tmpPath = self.statusPath + ".part"
+        with open(tmpPath, "w") as statusFile:
+            json.dump(self.getStatus(now), statusFile, ensure_ascii=False, indent=1)
+        os.replace(tmpPath, self.statusPath)
+        self.statusWrittenAt = now
+
+    def isIdle(self):
+        return not (self.settling or self.queue or self.inFlight)
+
+    def run(self, once=False):
+        self.store = mappingstore.MappingStore(self.dbPath)
+        observer = None if once else startObserver(self.watchDir, self.events)
+        if observer:
+            self.backend = type(observer).__name__
+        lastScan = 0
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                while True:
+                    now = time.time()
+                    if (observer is None and now - lastScan >= self.pollSeconds) or now - lastScan >= RESCAN_SECONDS:
+                        self.scanDir(now)
+                        lastScan = now
+                    while not self.events.empty():
+                        filePath = self.events.get()
+                        try:
+                            self.noteChange(filePath, now)
+                        except OSError as e:
+                            self.fileError(filePath, e, now)
+                    self.promoteSettled(now)
+                    self.submitQueued(pool)
+                    if now - self.statusWrittenAt >= STATUS_SECONDS:
+                        self.writeStatus(now)
+                    if once and self.isIdle():
+                        break
+                    if self.inFlight:
+                        done, _ = wait(self.inFlight, timeout=self.pollSeconds, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            self.fileFinished(future)
+                    else:
+                        time.sleep(min(self.pollSeconds, self.settleSeconds) if self.settling else self.pollSeconds)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if observer:
+                observer.stop()
+                observer.join()
+            self.writeStatus(time.time())
+            self.doneFiles.close()
+            if self.store:
+                self.store.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Следить за папкой и раскладывать теги в новых файлах")
+    parser.add_argument("config", help="путь к config.json или mapping.db")
+    parser.add_argument("columns", help="колонки с тегами через запятую: B или Лист!B,Доп. теги!C")
+    parser.add_argument("folder", help="папка, куда складывают файлы")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(),
+                        help="число параллельных процессов")
+    parser.add_argument("--status", help="файл состояния в JSON, по умолчанию %s в папке" % STATUS_NAME)
+    parser.add_argument("--state", help="база обработанных файлов, по умолчанию %s в папке" % STATE_NAME)
+    parser.add_argument("--interval", type=float, default=2.0, help="как часто проверять папку, секунд")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="сколько секунд файл не должен меняться, прежде чем его брать")
+    parser.add_argument("--once", action="store_true", help="обработать то, что уже лежит в папке, и выйти")
+    parser.add_argument("--db", help="база настроек, куда записывать новые теги; по умолчанию сама база из config "
+                                     "или mapping.db, если указан config.json")
+    args = parser.parse_args(argv)
+
+    sources = list(dict.fromkeys(engine.parseSource(source) for source in args.columns.split(",")))
+    watcher = FolderWatcher(args.folder, args.config, sources, workers=args.workers,
+                            statusPath=args.status, statePath=args.state,
+                            pollSeconds=args.interval, settleSeconds=args.settle, dbPath=args.db)
+    watcher.run(once=args.once)
+    return 1 if watcher.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,113 @@
+import posixpath
+import re
+import zipfile
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+from .engine import getColumnLetter
+
+XML_CHUNK = 1024 * 1024
+MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+DOC_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+ROW_END_RE = re.compile(rb"/>|>.*?</row>", re.S)
+CELL_RE = re.compile(rb'<c r="([A-Z]+)\d+"[^>]*?(?:/>|>.*?</c>)', re.S)
+
+
+class PatchError(Exception):
+    pass
+
+
+def getSheetPaths(xlZip):
+    # [(sheet title, path of its xml inside the zip)] in workbook order
+    workbook = ElementTree.fromstring(xlZip.read("xl/workbook.xml"))
+    rels = ElementTree.fromstring(xlZip.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(REL_NS + "Relationship")}
+    sheetPaths = []
+    for sheet in workbook.iter(MAIN_NS + "sheet"):
+        target = targets[sheet.get(DOC_REL_NS + "id")]
+        path = target.lstrip("/") if target.startswith("/") else posixpath.normpath(posixpath.join("xl", target))
+        sheetPaths.append((sheet.get("name"), path))
+    return sheetPaths
+
+
+def getSheetTitles(xlPath):
+    with zipfile.ZipFile(xlPath) as xlZip:
+        return [title for title, path in getSheetPaths(xlZip)]
+
+
+def makeCell(column, rowNum, value):
+    if value is None:
+        return b""
+    ref = "%s%d" % (column, rowNum)
+    value = str(value)
+    if not value:
+        return ('<c r="%s" t="inlineStr" />' % ref).encode("utf-8")
+    space = ' xml:space="preserve"' if value != value.strip() else ""
+    return ('<c r="%s" t="inlineStr"><is><t%s>%s</t></is></c>' % (ref, space, escape(value))).encode("utf-8")
+
+
+def patchRow(rowXml, openTagEnd, rowNum, rowCells):
+    # rowCells: {column index: value}; every other cell of the row is kept byte for byte
+    cells = dict()
+    for match in CELL_RE.finditer(rowXml, openTagEnd):
+        cells[match.group(1)] = match.group(0)
+    for colIdx, value in rowCells.items():
+        column = getColumnLetter(colIdx)
+        cells[column.encode("ascii")] = makeCell(column, rowNum, value)
+    ordered = sorted(cells.items(), key=lambda item: (len(item[0]), item[0]))
+    return rowXml[:openTagEnd] + b">" + b"".join(cell for column, cell in ordered) + b"</row>"
+
+
+def patchSheet(src, dst, cells):
+    # streams the sheet xml and rebuilds only the <row> elements listed in cells
+    buffer = b""
+    eof = False
+    for rowNum in sorted(cells):
+        rowStart = b'<row r="%d"' % rowNum
+        while True:
+            start = buffer.find(rowStart)
+            if start >= 0:
+                openTagEnd = start + len(rowStart)
+                while buffer[openTagEnd:openTagEnd + 1] not in (b">", b"/", b""):
+                    openTagEnd += 1
+                end = ROW_END_RE.match(buffer, openTagEnd)
+                if end:
+                    break
+            if eof:
+                raise PatchError("row %d not found" % rowNum)
+            keep = max(len(buffer) - len(rowStart), 0) if start < 0 else start
+            dst.write(buffer[:keep])
+            buffer = buffer[keep:]
+            chunk = src.read(XML_CHUNK)
+            eof = not chunk
+            buffer += chunk
+        dst.write(buffer[:start])
+        dst.write(patchRow(buffer[start:end.end()], openTagEnd - start, rowNum, cells[rowNum]))
+        buffer = buffer[end.end():]
+    dst.write(buffer)
+    for chunk in iter(lambda: src.read(XML_CHUNK), b""):
+        dst.write(chunk)
+
+
+def patchWorkbook(srcPath, dstPath, sheetCells):
+    # sheetCells: {sheet title or None for the first sheet: {row number: {column index: value}}}
+    with zipfile.ZipFile(srcPath) as srcZip, \
+            zipfile.ZipFile(dstPath, "w", compression=zipfile.ZIP_DEFLATED) as dstZip:
+        sheetPaths = getSheetPaths(srcZip)
+        patchedPaths = dict()
+        for title, cells in sheetCells.items():
+            paths = [path for sheetTitle, path in sheetPaths if title is None or sheetTitle == title]
+            if not paths:
+                raise PatchError("sheet %s not found" % title)
+            patchedCells = patchedPaths.setdefault(paths[0], dict())
+            for rowNum, rowCells in cells.items():
+                patchedCells.setdefault(rowNum, dict()).update(rowCells)
+        for info in srcZip.infolist():
+            if info.filename in patchedPaths:
+                dstInfo = zipfile.ZipInfo(info.filename, info.date_time)
+                dstInfo.compress_type = zipfile.ZIP_DEFLATED
+                with srcZip.open(info) as src, dstZip.open(dstInfo, "w", force_zip64=True) as dst:
+                    patchSheet(src, dst, patchedPaths[info.filename])
+            else:
+                dstZip.writestr(info, srcZip.read(info))
@@ -0,0 +1,17 @@
+import os
+
+import pytest
+
+from tagsparser import scancache
+
+
+@pytest.fixture(autouse=True)
+def scanCache(tmp_path, monkeypatch):
+    cacheDir = str(tmp_path / "cache")
+    # forked scan and watch workers open their own cache, which has to land here as well
+    monkeypatch.setenv(scancache.CACHE_DIR_ENV, cacheDir)
+    cache = scancache.ScanCache(cacheDir)
+    monkeypatch.setattr(scancache, "defaultCache", cache)
+    monkeypatch.setattr(scancache, "defaultCachePid", os.getpid())
+    yield cache
+    cache.close()
@@ -0,0 +1,66 @@
+import pytest
+
+from tagsparser import mappingstore
+
+
+def makeConf():
+    return {"unused": {"мусор", "прочее"},
+            "used": {"Цвет": {"default": "нет", "multiple": "[all]", "all": {"синий", "зелёный"},
+                              "rules": [{"type": "prefix", "pattern": "крас"}, {"type": "regex", "pattern": "^ж"}]},
+                     "Размер": {"default": "-", "multiple": "несколько", "all": {"XL"}, "rules": []}}}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = mappingstore.MappingStore(str(tmp_path / "mapping.db"))
+    yield store
+    store.close()
+
+
+def test_importLoadRoundTrip(store, tmp_path):
+    conf = makeConf()
+    store.importConfig(conf)
+    assert store.load() == conf
+    store.close()
+    reopened = mappingstore.MappingStore(str(tmp_path / "mapping.db"))
+    loaded = reopened.load()
+    reopened.close()
+    assert loaded == conf
+    assert list(loaded["used"]) == ["Цвет", "Размер"]
+
+
+def test_putColumnRenames(store):
+    store.importConfig(makeConf())
+    colData = {"default": "нет", "multiple": "[all]", "all": {"синий", "голубой"},
+               "rules": [{"type": "prefix", "pattern": "крас"}]}
+    store.putColumn("Оттенок", colData, replaces="Цвет")
+    used = store.load()["used"]
+    assert list(used) == ["Размер", "Оттенок"]
+    assert used["Оттенок"] == colData
+    assert store.connection.execute("SELECT COUNT(*) FROM columnTags WHERE columnName = 'Цвет'").fetchone()[0] == 0
+    assert store.connection.execute("SELECT COUNT(*) FROM columnRules WHERE columnName = 'Цвет'").fetchone()[0] == 0
+
+
+def test_loadPendingDropsClassifiedTags(store):
+    store.importConfig(makeConf())
+    store.addPending(["синий", "мусор", "новый", "ещё новый"], "in.xlsx")
+    assert store.loadPending() == {"новый", "ещё новый"}
+    store.addUnused(["новый"])
+    store.addColumnTags("Размер", ["ещё новый"])
+    assert store.loadPending() == set()
+    assert store.connection.execute("SELECT COUNT(*) FROM pendingTags").fetchone()[0] == 0
+
+
+def test_nestedTransactionRollsBack(store):
+    conf = makeConf()
+    store.importConfig(conf)
+    with pytest.raises(RuntimeError):
+        with store.transaction():
+            store.addUnused(["лишнее"])
+            with store.transaction():
+                store.delColumn("Размер")
+                raise RuntimeError
+    assert store.depth == 0
+    assert store.load() == conf
+    store.addUnused(["лишнее"])
+    assert "лишнее" in store.load()["unused"]
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+
+from tagsparser import profiling
+
+
+def test_importWithoutResource():
+    # the resource module does not exist on Windows
+    code = "import sys; sys.modules['resource'] = None; import tagsparser.engine, tagsparser.batch, tagsparser.watch"
+    subprocess.run([sys.executable, "-c", code], check=True,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def test_summaryWithoutPeakRss(monkeypatch):
+    monkeypatch.setattr(profiling, "resource", None)
+    tracer = profiling.Tracer()
+    with tracer.phase("scan.rows", rows=5):
+        pass
+    assert profiling.getPeakRssKb() is None
+    assert tracer.summary()["scan.rows"]["peakRssKb"] is None
+    assert tracer.summary()["scan.rows"]["rows"] == 5
+
+
+def test_summary():
+    tracer = profiling.Tracer()
+    for rows in (2, 3):
+        with tracer.phase("save.rows", rows=rows):
+            pass
+    total = tracer.summary()["save.rows"]
+    assert total["count"] == 2 and total["rows"] == 5
+    assert total["peakRssKb"] > 0
@@ -0,0 +1,51 @@
+import pytest
+
+from tagsparser import rules
+from tagsparser.engine import CompiledMapping
+
+
+def makeUsed(*columnRules):
+    return {"col%d" % colIdx: {"default": "-", "multiple": "*", "all": set(), "rules": colRules}
+            for colIdx, colRules in enumerate(columnRules)}
+
+
+def test_parseRules():
+    parsed = rules.parseRules("norm: Ёлка \n\nprefix:abc\nREGEX:^a+$")
+    assert parsed == [{"type": "norm", "pattern": "Ёлка"},
+                      {"type": "prefix", "pattern": "abc"},
+                      {"type": "regex", "pattern": "^a+$"}]
+    assert rules.parseRules(rules.formatRules(parsed)) == parsed
+
+
+@pytest.mark.parametrize("text", ["abc", "glob:abc", "prefix:", "regex:(abc"])
+def test_parseRulesRejects(text):
+    with pytest.raises(rules.RuleError):
+        rules.parseRules(text)
+
+
+def test_matchKinds():
+    matcher = rules.RuleMatcher([(0, [{"type": "norm", "pattern": "Ёлка  Зелёная"}]),
+                                 (1, [{"type": "prefix", "pattern": "Red"}]),
+                                 (2, [{"type": "substring", "pattern": "blue"}]),
+                                 (3, [{"type": "regex", "pattern": r"^\d+$"}])])
+    assert matcher.match("елка зеленая") == (0,)
+    assert matcher.match("reddish") == (1,)
+    assert matcher.match("dark BLUE sky") == (2,)
+    assert matcher.match("123") == (3,)
+    assert matcher.match("redblue") == (1, 2)
+    assert matcher.match("green") == ()
+
+
+def test_regexInlineFlags():
+    used = makeUsed(rules.parseRules("regex:(?i)^foo"), rules.parseRules("regex:(?s)a.b"))
+    mapping = CompiledMapping(used)
+    assert mapping.classify(["FOObar"]) == ["FOObar", "-"]
+    assert mapping.classify(["a\nb"]) == ["-", "a\nb"]
+
+
+def test_regexBackreferences():
+    used = makeUsed(rules.parseRules(r"regex:^(a)\1$"), rules.parseRules(r"regex:^(b)\1$"))
+    mapping = CompiledMapping(used)
+    assert mapping.classify(["aa"]) == ["aa", "-"]
+    assert mapping.classify(["bb"]) == ["-", "bb"]
+    assert mapping.classify(["ab"]) == ["-", "-"]
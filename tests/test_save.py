@@ -0,0 +1,138 @@
+import os
+
+import openpyxl
+import pytest
+
+from tagsparser import engine, profiling, xlsxpatch
+
+SOURCES = [(None, "B")]
+
+
+def makeUsed(tags):
+    return {"Цвет, основной": {"default": "нет, не задано", "multiple": "[all]", "all": set(tags), "rules": []}}
+
+
+def writeCsv(path, encoding="cp1251"):
+    lines = ["id;теги"] + ["%d;%s" % (rowIdx, ("зелёный", "синий")[rowIdx % 2]) for rowIdx in range(30)]
+    path.write_bytes(("\r\n".join(lines) + "\r\n").encode(encoding))
+    return str(path)
+
+
+def saveBoth(tmp_path, filePath, oldUsed, newUsed, sources=SOURCES):
+    scans = engine.scanSources(filePath, sources)
+    extension = os.path.splitext(filePath)[1]
+    outPath = str(tmp_path / ("out" + extension))
+    fullPath = str(tmp_path / ("full" + extension))
+    engine.saveTagColumns(filePath, sources, oldUsed, outPath=outPath, scans=scans)
+    assert engine.patchTagColumns(filePath, sources, engine.CompiledMapping(newUsed), outPath, scans)
+    engine.saveTagColumns(filePath, sources, newUsed, outPath=fullPath, scans=scans, incremental=False)
+    if extension == ".xlsx":
+        return readWorkbook(outPath), readWorkbook(fullPath)
+    with open(outPath, "rb") as outFile, open(fullPath, "rb") as fullFile:
+        return outFile.read(), fullFile.read()
+
+
+def readWorkbook(path):
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    sheets = {sheet.title: [list(row) for row in sheet.iter_rows(values_only=True)] for sheet in workbook}
+    workbook.close()
+    return sheets
+
+
+def writeXlsx(path):
+    workbook = openpyxl.Workbook()
+    goods = workbook.active
+    goods.title = "Товары"
+    goods.append(["id", "теги", "доп. теги"])
+    extra = workbook.create_sheet("Доп & <прочее>")
+    extra.append(["id", "теги"])
+    tags = ["a<b", "x & y", "\"q\"", "синий", "зелёный"]
+    for rowIdx in range(300):
+        goods.append([rowIdx, ", ".join(tags[rowIdx % 5:rowIdx % 5 + 2]), tags[rowIdx % 3]])
+        extra.append([rowIdx, tags[(rowIdx + 1) % 5]])
+    workbook.save(str(path))
+    return str(path)
+
+
+def test_detectCsvFormat(tmp_path):
+    assert engine.detectCsvFormat(writeCsv(tmp_path / "in.csv")) == ("cp1251", ";")
+    assert engine.detectCsvFormat(writeCsv(tmp_path / "in8.csv", "utf-8")) == ("utf-8", ";")
+
+
+def test_patchedCsvMatchesFullSave(tmp_path):
+    filePath = writeCsv(tmp_path / "in.csv")
+    patched, full = saveBoth(tmp_path, filePath, makeUsed(["красный"]), makeUsed(["синий"]))
+    assert patched == full
+    assert "\r\n1;синий;синий\r\n".encode("cp1251") in full
+
+
+def test_patchedXlsxMatchesFullSave(tmp_path, monkeypatch):
+    monkeypatch.setattr(xlsxpatch, "XML_CHUNK", 4096)
+    filePath = writeXlsx(tmp_path / "in.xlsx")
+    sources = [("Товары", "B"), ("Товары", "C"), ("Доп & <прочее>", "B")]
+    oldUsed = {"Знаки <&>": {"default": "нет & \"не задано\"", "multiple": "[all]", "all": {"a<b"}, "rules": []},
+               "Цвет": {"default": "-", "multiple": "<несколько>", "all": {"синий"}, "rules": []}}
+    newUsed = {"Знаки <&>": {"default": "нет & \"не задано\"", "multiple": "[all]", "all": {"a<b", "x & y", "\"q\""},
+                             "rules": []},
+               "Цвет": {"default": "-", "multiple": "<несколько>", "all": {"зелёный", "синий"}, "rules": []}}
+    patched, full = saveBoth(tmp_path, filePath, oldUsed, newUsed, sources)
+    assert patched == full
+    assert set(full) == {"Товары", "Доп & <прочее>"}
+    assert any("x & y" in row and "<несколько>" in row for row in full["Товары"])
+
+
+def test_unchangedMappingKeepsOutput(tmp_path):
+    filePath = writeCsv(tmp_path / "in.csv")
+    patched, full = saveBoth(tmp_path, filePath, makeUsed(["красный"]), makeUsed(["красный"]))
+    assert patched == full
+
+
+def test_previewMatchesSave(tmp_path):
+    path = tmp_path / "in.csv"
+    path.write_text("id;теги\n1;синий\n2;\n3;зелёный, синий\n4;красный\n", encoding="utf-8")
+    filePath = str(path)
+    used = makeUsed(["синий", "зелёный"])
+    scans = engine.scanSources(filePath, SOURCES)
+    preview = engine.previewClassification(scans, used)
+    outPath = engine.saveTagColumns(filePath, SOURCES, used, outPath=str(tmp_path / "out.csv"), scans=scans)
+    saved = list(engine.iterCsvRows(outPath))[1:]
+    assert [["" if value is None else value for value in row["values"]] for row in preview["rows"]] \
+        == [row[2:3] for row in saved]
+    assert [row["values"] for row in preview["rows"]] \
+        == [["синий"], [None], ["зелёный, синий"], ["нет, не задано"]]
+    assert preview["summary"][SOURCES[0]] == [{engine.EMPTY: 1, engine.DEFAULT: 1, engine.SINGLE: 1,
+                                               engine.MULTIPLE: 1}]
+
+
+def test_unencodableValueFailsBeforeWriting(tmp_path):
+    filePath = writeCsv(tmp_path / "in.csv")
+    used = makeUsed(["синий"])
+    used["Цвет, основной"]["default"] = "€ ✓"
+    outPath = tmp_path / "out.csv"
+    scans = engine.scanSources(filePath, SOURCES)
+    with pytest.raises(ValueError, match="cp1251"):
+        engine.saveTagColumns(filePath, SOURCES, used, outPath=str(outPath), scans=scans)
+    assert not outPath.exists()
+
+
+def test_classifyPhasesAreInsideSaveRows(tmp_path):
+    filePath = writeCsv(tmp_path / "in.csv")
+    scans = engine.scanSources(filePath, SOURCES)
+    profiling.tracer.clear()
+    engine.saveTagColumns(filePath, SOURCES, makeUsed(["синий"]), outPath=str(tmp_path / "out.csv"), scans=scans,
+                          incremental=False)
+    records = {record["name"]: record for record in profiling.tracer.records}
+    classify = [record for record in profiling.tracer.records if record["name"] == "save.classify"]
+    saveRows = records["save.rows"]
+    assert sum(record["rows"] for record in classify) == 30
+    for record in classify:
+        assert saveRows["start"] <= record["start"]
+        assert record["start"] + record["wallSeconds"] <= saveRows["start"] + saveRows["wallSeconds"]
+
+
+def test_negativePreviewLimitShowsNothing(tmp_path):
+    filePath = writeCsv(tmp_path / "in.csv")
+    scans = engine.scanSources(filePath, SOURCES)
+    for sample in (False, True):
+        preview = engine.previewClassification(scans, makeUsed(["синий"]), rowLimit=-5, sample=sample)
+        assert preview["rows"] == []
@@ -0,0 +1,70 @@
+import random
+
+import pytest
+
+from tagsparser import tagindex
+from tagsparser.tagindex import NGRAM, FilteredTags, TagIndex
+
+TAGS = ["Красный", "красное дерево", "Ёлка", "ёжик", "Синий", "синева", "Red", "reddish", "bored", "ЗЕЛЁНЫЙ"]
+
+
+def expected(items, query):
+    folded = query.strip().casefold()
+    visible = [(group, text.casefold(), text) for text, group in items.items()
+               if (text.casefold().startswith(folded) if len(folded) < NGRAM else folded in text.casefold())]
+    return [text for group, folded, text in sorted(visible)]
+
+
+def test_search():
+    index = TagIndex(TAGS)
+    assert index.search("кр") == {"Красный", "красное дерево"}
+    assert index.search("red") == {"Red", "reddish", "bored"}
+    assert index.search("дерев") == {"красное дерево"}
+    assert index.search("xyz") == set()
+    index.remove("bored")
+    index.add("Reddit")
+    assert index.search("red") == {"Red", "reddish", "Reddit"}
+
+
+def test_filterKeepsOrder():
+    items = {text: colIdx % 2 for colIdx, text in enumerate(TAGS)}
+    tags = FilteredTags()
+    tags.setItems([(group, {"text": text}) for text, group in items.items()])
+    for query in ["", "к", "кр", "red", "redd", "reddish", "  ", "е", "ё", "red"]:
+        tags.setFilter(query)
+        assert tags.getVisibleTexts() == expected(items, query)
+        assert [item["text"] for item in tags.visibleItems] == tags.getVisibleTexts()
+
+
+@pytest.mark.parametrize("maxInplace", [10, 1000])
+def test_changesKeepOrder(monkeypatch, maxInplace):
+    # both the in-place path and the bulk rebuild of applyChanges
+    monkeypatch.setattr(tagindex, "MAX_INPLACE_CHANGES", maxInplace)
+    random.seed(1)
+    words = ["tag", "red", "стол", "синий"]
+    pool = ["%s %s %d" % (random.choice(words), random.choice(words), n) for n in range(300)]
+    items = {text: random.randint(0, 1) for text in pool[:150]}
+    tags = FilteredTags()
+    tags.setItems([(group, {"text": text}) for text, group in items.items()], TagIndex(pool[:100]))
+    for step in range(200):
+        tags.setFilter(random.choice(["", "t", "ta", "tag", "tag r", "red", "сто", "1"]))
+        if step % 3 == 0:
+            text = random.choice(pool)
+            items[text] = random.randint(0, 1)
+            tags.add(items[text], {"text": text})
+        elif step % 3 == 1 and items:
+            text = random.choice(list(items))
+            del items[text]
+            tags.remove(text)
+        else:
+            removed = random.sample(list(items), min(len(items), random.randint(0, 40)))
+            added = {text: random.randint(0, 1) for text in random.sample(pool, random.randint(0, 40))}
+            for text in removed:
+                del items[text]
+            items.update(added)
+            tags.applyChanges(removed, [(group, {"text": text}) for text, group in added.items()])
+        assert tags.getVisibleTexts() == expected(items, tags.query)
+        assert [item["text"] for item in tags.visibleItems] == tags.getVisibleTexts()
+        assert sorted(tags.groups) == sorted(items)
+        for text in tags.getVisibleTexts():
+            assert tags.getVisibleTexts()[tags.indexOf(text)] == text
@@ -0,0 +1,101 @@
+from tagsparser import tagmodel
+
+
+def makeConf():
+    return {"unused": {"old"},
+            "used": {"Цвет": {"default": "-", "multiple": "*", "all": {"red", "blue"}, "rules": []}}}
+
+
+def test_pendingTagsStayPendingOnSave():
+    model = tagmodel.TagStateModel(makeConf())
+    model.loadSheet({"red", "green", "old"}, pendingTags={"green", "violet", "old", "blue"})
+    assert model.newTags == {"green", "violet"}
+    assert model.commitNewTags() == {"green"}
+    assert model.conf["unused"] == {"old", "green"}
+
+
+def makeModel():
+    model = tagmodel.TagStateModel(makeConf())
+    model.loadSheet({"red", "blue", "green", "yellow", "old"})
+    return model
+
+
+def test_loadSheet():
+    model = makeModel()
+    assert model.newTags == {"green", "yellow"}
+    assert model.unusedTags == {"old"}
+    assert model.getState("red") == tagmodel.ASSIGNED
+    assert model.getState("missing") is None
+
+
+def test_markUnused():
+    model = makeModel()
+    model.select({"green", "yellow"})
+    assert model.markUnused(["green", "red", "old"]) == ["green"]
+    assert model.getState("green") == tagmodel.UNUSED
+    assert model.getState("red") == tagmodel.ASSIGNED
+    assert model.conf["unused"] == {"old", "green"}
+    assert model.selectedTags == {"yellow"}
+
+
+def test_renameColumn():
+    model = makeModel()
+    colData, addedToUnused = model.updateColumn("Color", "Цвет", "none", "many", {"red"})
+    assert list(model.conf["used"]) == ["Color"]
+    assert colData == {"default": "none", "multiple": "many", "rules": [], "all": {"red"}}
+    assert model.tagColumns["red"] == {"Color"}
+    assert "blue" not in model.tagColumns
+    assert addedToUnused == ["blue"]
+    assert model.getState("blue") == tagmodel.UNUSED
+
+
+def test_deleteColumn():
+    model = makeModel()
+    model.assign(["green"], "Цвет")
+    assert sorted(model.deleteColumn("Цвет")) == ["blue", "red"]
+    assert model.conf["used"] == {}
+    assert model.conf["unused"] == {"old", "red", "blue"}
+    assert model.getState("green") == tagmodel.NEW
+    assert model.getState("red") == tagmodel.UNUSED
+    assert model.tagColumns == {}
+
+
+def test_deleteColumnKeepsRuleMatches():
+    model = makeModel()
+    model.updateColumn("Размер", "", "-", "*", set(), [{"type": "prefix", "pattern": "gr"}])
+    assert model.getState("green") == tagmodel.ASSIGNED
+    model.deleteColumn("Размер")
+    assert model.getState("green") == tagmodel.NEW
+
+
+def test_listeners():
+    model = makeModel()
+    changes = []
+    model.listeners.append(lambda *change: changes.append(change))
+    model.markUnused(["green"])
+    assert changes == [("green", tagmodel.NEW, tagmodel.UNUSED)]
+
+
+def test_batchListeners():
+    model = makeModel()
+    single = []
+    batches = []
+    model.listeners.append(lambda *change: single.append(change))
+    model.batchListeners.append(batches.append)
+    with model.batch():
+        model.assign(["green"], "Цвет")
+        with model.batch():
+            model.markUnused(["yellow"])
+        assert batches == []
+    assert single == []
+    assert batches == [[("green", tagmodel.NEW, tagmodel.ASSIGNED), ("yellow", tagmodel.NEW, tagmodel.UNUSED)]]
+
+
+def test_batchWithoutBatchListeners():
+    model = makeModel()
+    single = []
+    model.listeners.append(lambda *change: single.append(change))
+    with model.batch():
+        model.markUnused(["green", "yellow"])
+        assert single == []
+    assert sorted(single) == [("green", tagmodel.NEW, tagmodel.UNUSED), ("yellow", tagmodel.NEW, tagmodel.UNUSED)]
@@ -0,0 +1,62 @@
+import os
+
+from tagsparser import engine, mappingstore, scancache, watch
+
+
+def makeWatcher(tmp_path):
+    return watch.FolderWatcher(str(tmp_path), str(tmp_path / "config.json"), [(None, "B")],
+                               workers=1, statePath=str(tmp_path / "state.db"), settleSeconds=0)
+
+
+def test_vanishedFolderIsRecorded(tmp_path):
+    watcher = makeWatcher(tmp_path)
+    watcher.watchDir = str(tmp_path / "missing")
+    watcher.scanDir(0)
+    assert [error["path"] for error in watcher.errors] == [watcher.watchDir]
+    watcher.doneFiles.close()
+
+
+def test_unreadableFileIsRecordedAndRetried(tmp_path, monkeypatch):
+    filePath = tmp_path / "in.csv"
+    filePath.write_text("id;теги\n1;a\n", encoding="utf-8")
+    watcher = makeWatcher(tmp_path)
+
+    def lockedHash(path):
+        raise PermissionError(13, "locked", path)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(scancache.getCache(), "getFileHash", lockedHash)
+        watcher.scanDir(0)
+        watcher.promoteSettled(1)
+        assert [error["path"] for error in watcher.errors] == [str(filePath)]
+        assert not watcher.queue
+
+    watcher.scanDir(2)
+    watcher.promoteSettled(3)
+    assert [queued[0] for queued in watcher.queue] == [str(filePath)]
+    watcher.doneFiles.close()
+
+
+def test_vanishedFileIsSkipped(tmp_path):
+    filePath = tmp_path / "in.csv"
+    filePath.write_text("id;теги\n1;a\n", encoding="utf-8")
+    watcher = makeWatcher(tmp_path)
+    watcher.scanDir(0)
+    os.remove(filePath)
+    watcher.promoteSettled(1)
+    assert not watcher.queue and not watcher.errors
+    watcher.doneFiles.close()
+
+
+def test_newTagsFromJsonConfigArePending(tmp_path):
+    configPath = str(tmp_path / "config.json")
+    engine.saveConfig({"used": {}, "unused": {"b"}}, configPath)
+    (tmp_path / "in.csv").write_text("id;теги\n1;a, b\n", encoding="utf-8")
+    dbPath = str(tmp_path / "mapping.db")
+    watcher = watch.FolderWatcher(str(tmp_path), configPath, [(None, "B")], workers=1,
+                                  statePath=str(tmp_path / "state.db"), settleSeconds=0, dbPath=dbPath)
+    watcher.run(once=True)
+    assert watcher.processed == 1
+    store = mappingstore.MappingStore(dbPath)
+    assert store.loadPending() == {"a"}
+    store.close()